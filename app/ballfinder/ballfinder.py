@@ -26,9 +26,46 @@
 ## Description: Detector of spherical objects in images.
 #############################################################################
 
+import copy
+import logging
+
+import cv2
+import numpy as np
+
+from .cammodel import as_camera_model
 from .det_util import *
 from .det_hough import detect_hough
-from .det_yolo import init_yolo, detect_yolo
+from .det_yolo import init_yolo, detect_yolo, detect_yolo_contours
+from .detection import Detection
+from .instrument import NullInstrument
+
+logger = logging.getLogger(__name__)
+
+# Config values read by the cacheable stages, (section, key) pairs.
+YOLO_KEYS = [
+    ("YOLO", "model"),
+    ("YOLO", "classId"),
+    ("YOLO", "minConfidence"),
+    ("YOLO", "maskContours"),
+    ("YOLO", "imgsz"),
+]
+BLUR_KEYS = [("GaussianBlur", "ksize"), ("GaussianBlur", "sigmaX")]
+CANNY_KEYS = [("Canny", "threshold1"), ("Canny", "threshold2")]
+HOUGH_KEYS = [
+    ("Dilate", "kernel"),
+    ("Dilate", "iterations"),
+    ("HoughCircles", "dp"),
+    ("HoughCircles", "minDist"),
+    ("HoughCircles", "param1"),
+    ("HoughCircles", "param2"),
+    ("HoughCircles", "minRadius"),
+    ("HoughCircles", "maxRadius"),
+]
+CONTOUR_KEYS = [
+    ("FindContours", "points"),
+    ("FindContours", "minRelScale"),
+    ("FindContours", "maxRelScale"),
+]
 
 
 class BallFinder(object):
@@ -37,11 +74,21 @@ class BallFinder(object):
     # Initialize the detector of balls.
 
     # cfg: configuration dict
+    # instr: Instrument to record the stage timings and counts, optional
+    # cache: StageCache to reuse the 2D stages of repeated frames, optional;
+    #   it also keeps the YOLO model, so it must not be used by several
+    #   threads at the same time
 
-    def __init__(self, cfg):
+    def __init__(self, cfg, instr=None, cache=None):
         self.cfg = cfg
+        self.instr = NullInstrument() if instr is None else instr
+        self.cache = cache
         if self.cfg["Detector"] == "YOLO":
-            self.yolo = init_yolo(self.cfg["YOLO"]["model"])
+            model = self.cfg["YOLO"]["model"]
+            if cache is None:
+                self.yolo = init_yolo(model)
+            else:
+                self.yolo = cache.resource(("yolo", model), lambda: init_yolo(model))
             return
         if self.cfg["Detector"] == "HOUGH":
             return
@@ -52,66 +99,236 @@ class BallFinder(object):
 
     # img_bgr: color image, array [H x W x 3]
     # radius: float, a priori known ball radius
-    # camera: dict of camera parameters
+    # camera: dict of camera parameters, or CameraModel
+    # scale: float, resize the image by this factor for the 2D stages;
+    #   the candidates and contours are scaled back. The pixel sizes of
+    #   the config must match, see scaled_config()
     # return: (res, err),
     #   res: list of detections
-    #     detection: dict, main fields: {
+    #     detection: Detection (dict), main fields: {
     #       'target': (X, Y, Z, radius),
-    #       '2d_center': (x, y),
-    #       '2d_contour': [(x, y), ...],
+    #       '2d_center': (x, y), lazy, see Detection
+    #       '2d_contour': [(x, y), ...], lazy, see Detection
     #       'candidate': (x, y, r)
     #     }
     #   err: string of error messages, empty on success
 
-    def find_balls(self, img_bgr, radius, camera):
+    def find_balls(self, img_bgr, radius, camera, scale=1.0):
         res = []
         try:
-            (img_c, fun_c) = canny(img_bgr, self.cfg)
-            if self.cfg["Detector"] == "YOLO":
-                cands_0 = detect_yolo(self.yolo, img_bgr, self.cfg)
-            if self.cfg["Detector"] == "HOUGH":
-                cands_0 = detect_hough(img_c, self.cfg)
-            conts_0 = [find_contour(cand, fun_c, self.cfg) for cand in cands_0]
-            (cands_1, conts_1) = ([], [])
-            for cand, cont in zip(cands_0, conts_0):
-                if not valid_contour(cont, self.cfg):
-                    continue
-                cands_1.append(cand)
-                conts_1.append(cont)
-            cones_1 = [
-                find_cone(cand, cont, camera) for (cand, cont) in zip(cands_1, conts_1)
-            ]
-            balls_1 = [fit_ball(cone, radius) for cone in cones_1]
-            balls_2 = [
-                refine_ball(ball, cone, radius, self.cfg)
-                for (ball, cone) in zip(balls_1, cones_1)
-            ]
-            ctrps_2 = [
-                project_center(ball, cand, radius, camera)
-                for (ball, cand) in zip(balls_2, cands_1)
-            ]
-            conts_2 = [
-                project_contour(ball, cont, radius, camera, self.cfg)
-                for (ball, cont) in zip(balls_2, conts_1)
-            ]
-
-            for cand, ball, ctrp, cont in zip(cands_1, balls_2, ctrps_2, conts_2):
-                (x, y, r) = cand
-                (X, Y, Z) = ball
-                (a, b) = ctrp
-                res.append(
-                    {
-                        "target": (X, Y, Z, radius),
-                        "2d_center": (a, b),
-                        "2d_contour": [(x, y) for (x, y) in cont],
-                        "candidate": (x, y, r),
-                    }
-                )
-
+            with self.instr.stage("frame"):
+                (cands, conts) = self.__find_scaled(img_bgr, scale)
+                res = self.locate(cands, conts, radius, camera)
         except Exception as e:
-            print(e)
+            logger.debug("find_balls failed", exc_info=True)
             return (res, str(e))
+        finally:
+            self.instr.end_frame()
         return (res, "")
 
+    ##---------------------------------------------------------------------------
+    # Detect the 2D candidates and contours of balls in an image.
+
+    # The result does not depend on the ball radius or the camera, so
+    # it can be stored and passed to locate() or locate_balls() again
+    # after either of them changes.
+
+    # img_bgr: color image, array [H x W x 3]
+    # scale: float, see find_balls()
+    # return: (cands, conts, err),
+    #   cands: list of candidates with valid contours, array [3], (x, y, r)
+    #   conts: list of contours, one per candidate,
+    #     contour: list of contour points, array [2], (x, y)
+    #   err: string of error messages, empty on success
+
+    def find_candidates(self, img_bgr, scale=1.0):
+        try:
+            with self.instr.stage("frame"):
+                (cands, conts) = self.__find_scaled(img_bgr, scale)
+        except Exception as e:
+            logger.debug("find_candidates failed", exc_info=True)
+            return ([], [], str(e))
+        finally:
+            self.instr.end_frame()
+        return (cands, conts, "")
+
+    ##---------------------------------------------------------------------------
+    # Locate balls in 3D from their 2D candidates and contours.
+
+    # cands, conts: see find_candidates()
+    # radius: float, a priori known ball radius
+    # camera: dict of camera parameters, or CameraModel
+    # return: list of detections, see find_balls()
+
+    def locate(self, cands, conts, radius, camera):
+        [res] = locate_balls([(cands, conts)], radius, camera, self.cfg, self.instr)
+        return res
+
+    def __find_scaled(self, img_bgr, scale):
+        if scale == 1.0:
+            return self.__find_candidates(img_bgr)
+        with self.instr.stage("resize"):
+            img_bgr = cv2.resize(
+                img_bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        (cands, conts) = self.__find_candidates(img_bgr)
+        return scale_candidates(cands, conts, 1.0 / scale)
+
+    def __find_candidates(self, img_bgr):
+        cfg = self.cfg
+
+        # Cache keys of the stage outputs, None without a cache.
+        k_frame = None
+        if self.cache is not None:
+            k_frame = self.cache.frame_key(img_bgr)
+        conts_0 = None
+        if cfg["Detector"] == "YOLO":
+            if cfg["YOLO"]["maskContours"]:
+                (k_cands, (cands_0, conts_0)) = self.__stage(
+                    "yolo",
+                    [k_frame],
+                    YOLO_KEYS + [("FindContours", "points")],
+                    lambda: detect_yolo_contours(self.yolo, img_bgr, cfg),
+                )
+            else:
+                (k_cands, cands_0) = self.__stage(
+                    "yolo",
+                    [k_frame],
+                    YOLO_KEYS,
+                    lambda: detect_yolo(self.yolo, img_bgr, cfg),
+                )
+        if conts_0 is None:
+            if cfg["Detector"] == "YOLO":
+                (k_edges, img_c) = self.__stage(
+                    "edges",
+                    [k_frame, k_cands],
+                    BLUR_KEYS + CANNY_KEYS + [("FindContours", "maxRelScale")],
+                    lambda: canny_rois(img_bgr, cands_0, cfg),
+                )
+            if cfg["Detector"] == "HOUGH":
+                (k_blur, img_b) = self.__stage(
+                    "blur", [k_frame], BLUR_KEYS, lambda: gray_blur(img_bgr, cfg)
+                )
+                (k_edges, img_c) = self.__stage(
+                    "edges", [k_blur], CANNY_KEYS, lambda: canny_edges(img_b, cfg)
+                )
+                (k_cands, cands_0) = self.__stage(
+                    "hough", [k_edges], HOUGH_KEYS, lambda: detect_hough(img_c, cfg)
+                )
+            (_, conts_0) = self.__stage(
+                "contours",
+                [k_edges, k_cands],
+                CONTOUR_KEYS,
+                lambda: find_contours(cands_0, img_c, cfg),
+            )
+        (cands_1, conts_1) = ([], [])
+        for cand, cont in zip(cands_0, conts_0):
+            if not valid_contour(cont, cfg):
+                continue
+            cands_1.append(cand)
+            conts_1.append(cont)
+        self.instr.count("candidates", len(cands_0))
+        return (cands_1, conts_1)
+
+    ##---------------------------------------------------------------------------
+    # Run a 2D stage, or take its output from the cache.
+
+    # name: stage name
+    # deps: list of keys of the stage inputs, None without a cache
+    # keys: list of config values read by the stage, (section, key) pairs
+    # compute: function without arguments, running the stage
+    # return: (key, output), key is None without a cache
+
+    def __stage(self, name, deps, keys, compute):
+        with self.instr.stage(name):
+            if self.cache is None:
+                return (None, compute())
+            params = [[sec, key, self.cfg[sec][key]] for (sec, key) in keys]
+            key = self.cache.stage_key(name, deps, params)
+            return (key, self.cache.get(key, compute))
+
+
+##-----------------------------------------------------------------------------
+# Locate balls in 3D for many frames at once.
+
+# The candidates of all frames are solved together: one view ray lookup
+# and one batched fit for all balls, e.g. to re-solve a whole processed
+# video after the ball radius or the camera calibration has changed.
+
+# frames: list of (cands, conts) per frame, see BallFinder.find_candidates()
+# radius: float, a priori known ball radius
+# camera: dict of camera parameters, or CameraModel
+# cfg: configuration dict
+# instr: Instrument to record the stage timings and counts, optional
+# return: list of detections per frame, see BallFinder.find_balls()
+
+
+def locate_balls(frames, radius, camera, cfg, instr=None):
+    instr = NullInstrument() if instr is None else instr
+    camera = as_camera_model(camera)
+    (cands_1, conts_1) = ([], [])
+    for cands, conts in frames:
+        cands_1.extend(cands)
+        conts_1.extend(conts)
+    instr.count("balls", len(cands_1))
+    instr.count("points", sum(len(cont) for cont in conts_1))
+    with instr.stage("cones"):
+        cones_1 = find_cones(cands_1, conts_1, camera)
+    with instr.stage("fit"):
+        if cfg["Fitting"] == "CONIC":
+            balls_2 = fit_balls_conic(cones_1, radius)
+        else:
+            balls_1 = fit_balls(cones_1, radius)
+            balls_2 = refine_balls(balls_1, cones_1, radius, cfg)
+
+    # Split the balls by frame.
+    res = []
+    balls = iter(balls_2)
+    for cands, conts in frames:
+        res.append(
+            [
+                Detection(ball, cand, cont, radius, camera, cfg)
+                for (cand, ball, cont) in zip(cands, balls, conts)
+            ]
+        )
+    return res
+
+
+##-----------------------------------------------------------------------------
+# Adapt the pixel sizes of a configuration to a resized image.
+
+# cfg: configuration dict
+# scale: float, factor the image is resized by
+# return: configuration dict, a copy unless scale is 1
+
+
+def scaled_config(cfg, scale):
+    if scale == 1.0:
+        return cfg
+    cfg = copy.deepcopy(cfg)
+    hough = cfg["HoughCircles"]
+    for key in ("minDist", "minRadius", "maxRadius"):
+        hough[key] = max(int(round(hough[key] * scale)), 1)
+    cfg["Dilate"]["kernel"] = max(int(round(cfg["Dilate"]["kernel"] * scale)), 1)
+
+    # The blur kernel size must stay odd.
+    ksz = cfg["GaussianBlur"]["ksize"]
+    cfg["GaussianBlur"]["ksize"] = max(int(round(ksz * scale)) // 2 * 2 + 1, 1)
+    return cfg
+
+
+##-----------------------------------------------------------------------------
+# Scale 2D candidates and contours, e.g. back to the full image size.
+
+# cands, conts: see BallFinder.find_candidates()
+# scale: float
+# return: (cands, conts)
+
+
+def scale_candidates(cands, conts, scale):
+    cands = [np.asarray(cand, dtype=float) * scale for cand in cands]
+    conts = [[np.asarray(q, dtype=float) * scale for q in cont] for cont in conts]
+    return (cands, conts)
+
 
 ##-----------------------------------------------------------------------------
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+##
+## Description: Pre-compiled camera model for batched projections.
+#############################################################################
+
+import numpy as np
+
+from .ocvcam import cv_view_rays, from_ipar, tilt_matrix, to_ipar
+
+
+class CameraModel(object):
+
+    # Same projection model as ocvcam.cvcore(); the parameters are unpacked
+    # once, and groups of zero coefficients are skipped altogether.
+
+    __slots__ = (
+        "intrinsics",
+        "ray_lut",
+        "ipar",
+        "fx",
+        "fy",
+        "cx",
+        "cy",
+        "k",
+        "p",
+        "s",
+        "radial",
+        "rational",
+        "tangential",
+        "prism",
+        "tilted",
+        "mm",
+        "mm_inv",
+    )
+
+    ##---------------------------------------------------------------------------
+    # Compile the camera model.
+
+    # cam: dict of camera parameters, optionally with a "ray_lut" (RayLUT)
+
+    def __init__(self, cam):
+        imtx = np.array(cam["intrinsics"]["camera_matrix"])
+        dist = np.array(cam["intrinsics"]["distortion_coefficients"])
+        ipar = to_ipar(imtx, dist.reshape((1, -1)))
+        ipar.setflags(write=False)
+        (fx, fy, cx, cy, k1, k2, p1, p2, k3, k4, k5, k6, s1, s2, s3, s4, tx, ty) = ipar
+
+        init = object.__setattr__
+        init(self, "intrinsics", cam["intrinsics"])
+        init(self, "ray_lut", cam.get("ray_lut"))
+        init(self, "ipar", ipar)
+        init(self, "fx", fx)
+        init(self, "fy", fy)
+        init(self, "cx", cx)
+        init(self, "cy", cy)
+        init(self, "k", (k1, k2, k3, k4, k5, k6))
+        init(self, "p", (p1, p2))
+        init(self, "s", (s1, s2, s3, s4))
+
+        # Coefficient groups which are actually in use.
+        init(self, "radial", any([k1, k2, k3]))
+        init(self, "rational", any([k4, k5, k6]))
+        init(self, "tangential", any([p1, p2]))
+        init(self, "prism", any([s1, s2, s3, s4]))
+        init(self, "tilted", any([tx, ty]))
+
+        mm = tilt_matrix(tx, ty)
+        mm_inv = np.linalg.inv(mm)
+        mm.setflags(write=False)
+        mm_inv.setflags(write=False)
+        init(self, "mm", mm)
+        init(self, "mm_inv", mm_inv)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CameraModel is immutable")
+
+    def __reduce__(self):
+        cam = {"intrinsics": self.intrinsics, "ray_lut": self.ray_lut}
+        return (CameraModel, (cam,))
+
+    ##---------------------------------------------------------------------------
+    # Names of the coefficient groups in use, ["pinhole"] if none.
+
+    @property
+    def kind(self):
+        names = ["radial", "rational", "tangential", "prism", "tilted"]
+        kind = [name for name in names if getattr(self, name)]
+        return kind if kind else ["pinhole"]
+
+    @property
+    def distorted(self):
+        return self.radial or self.rational or self.tangential or self.prism
+
+    ##---------------------------------------------------------------------------
+    # Apply lens distortions (step 3 of the projection model).
+
+    # xp, yp: arrays [N], undistorted normalized coordinates (x', y')
+    # return: (xpp, ypp), distorted coordinates (x'', y'')
+
+    def distort(self, xp, yp):
+        (k1, k2, k3, k4, k5, k6) = self.k
+        (p1, p2) = self.p
+        (s1, s2, s3, s4) = self.s
+        r2 = xp**2 + yp**2
+        (xpp, ypp) = (xp, yp)
+
+        if self.radial or self.rational:
+            ff = 1 + k1 * r2 + k2 * r2**2 + k3 * r2**3
+            if self.rational:
+                ffd = 1 + k4 * r2 + k5 * r2**2 + k6 * r2**3
+                assert np.all(np.fabs(ffd) > 1.0e-8)  # sanity check
+                ff = ff / ffd
+            (xpp, ypp) = (xp * ff, yp * ff)
+
+        if self.tangential:
+            xpp = xpp + 2 * p1 * xp * yp + p2 * (r2 + 2 * xp**2)
+            ypp = ypp + p1 * (r2 + 2 * yp**2) + 2 * p2 * xp * yp
+
+        if self.prism:
+            xpp = xpp + s1 * r2 + s2 * r2**2
+            ypp = ypp + s3 * r2 + s4 * r2**2
+
+        return (xpp, ypp)
+
+    ##---------------------------------------------------------------------------
+    # Project 3D points to 2D image points.
+
+    # ps: array [N x 3], (x, y, z) rows, 3D points in the camera's coordinates
+    # return: qs, array [N x 2], (u, v) rows, 2D sensor points
+
+    def project(self, ps):
+        ps = np.asarray(ps, dtype=float).reshape((-1, 3))
+
+        # Step 1, factors (-1) as in cvcore().
+        (xp, yp) = (-1.0 * ps[:, 0] / ps[:, 2], -1.0 * ps[:, 1] / ps[:, 2])
+
+        # Steps 2-3: distortions.
+        (xpp, ypp) = (xp, yp)
+        if self.distorted:
+            (xpp, ypp) = self.distort(xp, yp)
+
+        # Steps 4-5: tilt.
+        (xppp, yppp) = (xpp, ypp)
+        if self.tilted:
+            mm = self.mm
+            zu = mm[2, 0] * xpp + mm[2, 1] * ypp + mm[2, 2]
+            xppp = (mm[0, 0] * xpp + mm[0, 1] * ypp + mm[0, 2]) / zu
+            yppp = (mm[1, 0] * xpp + mm[1, 1] * ypp + mm[1, 2]) / zu
+
+        # Step 6: image chip coordinates.
+        return np.stack([self.fx * xppp + self.cx, self.fy * yppp + self.cy], axis=1)
+
+    ##---------------------------------------------------------------------------
+    # Find view ray directions for 2D sensor points.
+
+    # Rays are looked up in the ray table if there is one. Otherwise the
+    # steps are inverted directly for cameras without distortions, and by
+    # ocvcam.cv_view_rays() for the others.
+
+    # qs: array [N x 2], (u, v) rows, 2D sensor points
+    # tolerance: allowed residual re-projection error
+    # check_conv: whether to verify the re-projection convergence
+    # max_iter, max_halving, xtol: see ocvcam.cv_view_rays()
+    # return: (rs, conv)
+    #   rs: array [N x 3], (rx, ry, rz) rows, view ray direction vectors
+    #   conv: array [N] of bool, re-projection error is below tolerance
+
+    def view_rays(
+        self,
+        qs,
+        tolerance=1.0e-3,
+        check_conv=False,
+        max_iter=20,
+        max_halving=8,
+        xtol=1.0e-12,
+    ):
+        qs = np.asarray(qs, dtype=float).reshape((-1, 2))
+
+        if self.ray_lut is not None:
+            (rs, inside) = self.ray_lut.view_rays(qs)
+            conv = inside.copy()
+            if not np.all(inside):
+                (rs[~inside], conv[~inside]) = self.__solve(
+                    qs[~inside], tolerance, max_iter, max_halving, xtol
+                )
+        else:
+            (rs, conv) = self.__solve(qs, tolerance, max_iter, max_halving, xtol)
+
+        if check_conv:
+            assert np.all(conv)
+        return (rs, conv)
+
+    def __solve(self, qs, tolerance, max_iter, max_halving, xtol):
+        if self.distorted:
+            (imtx, dist) = from_ipar(self.ipar)
+            return cv_view_rays(
+                qs,
+                imtx,
+                dist,
+                tolerance,
+                max_iter=max_iter,
+                max_halving=max_halving,
+                xtol=xtol,
+            )
+
+        # Invert step 6.
+        xppp = (qs[:, 0] - self.cx) / self.fx
+        yppp = (qs[:, 1] - self.cy) / self.fy
+
+        # Invert steps 4-5.
+        (xp, yp) = (xppp, yppp)
+        if self.tilted:
+            mi = self.mm_inv
+            zu = mi[2, 0] * xppp + mi[2, 1] * yppp + mi[2, 2]
+            xp = (mi[0, 0] * xppp + mi[0, 1] * yppp + mi[0, 2]) / zu
+            yp = (mi[1, 0] * xppp + mi[1, 1] * yppp + mi[1, 2]) / zu
+
+        # Recover the view ray directions, factors (-1) as in cvcore().
+        rs = np.stack([-xp, -yp, np.ones_like(xp)], axis=1)
+
+        # Convergence quality, same criterion as in ocvcam.cv_view_ray().
+        err = np.linalg.norm(self.project(rs) - qs, axis=1)
+        return (rs, err < tolerance)
+
+
+##-----------------------------------------------------------------------------
+# Compile a camera model, unless it is compiled already.
+
+# cam: dict of camera parameters, or CameraModel
+# return: CameraModel
+
+
+def as_camera_model(cam):
+    if isinstance(cam, CameraModel):
+        return cam
+    return CameraModel(cam)
+
+
+##-----------------------------------------------------------------------------
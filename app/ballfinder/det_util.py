@@ -28,9 +28,8 @@
 
 import cv2
 import numpy as np
-import scipy
 
-from .ocvcam import cv_project, cv_view_ray
+from .cammodel import as_camera_model
 
 
 ##-----------------------------------------------------------------------------
@@ -38,87 +37,197 @@ from .ocvcam import cv_project, cv_view_ray
 
 # img_bgr: color image, array [H x W x 3]
 # cfg: configuration dict
-# return: (img_c, fun_c)
-#   img_c: binary contour map, array [H x W]
-#   fun_c: contour indicator function, defined over [0, H] x [0, W]
+# return: img_c, binary contour map, array [H x W]
 
 
 def canny(img_bgr, cfg):
+    img_b = gray_blur(img_bgr, cfg)
+    img_c = canny_edges(img_b, cfg)
+    return img_c
+
+
+##-----------------------------------------------------------------------------
+# Convert an image to grayscale and smooth it, the first step of canny().
+
+# img_bgr: color image, array [H x W x 3]
+# cfg: configuration dict
+# return: img_b, blurred grayscale image, array [H x W]
+
+
+def gray_blur(img_bgr, cfg):
     img_g = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
     ksz = cfg["GaussianBlur"]["ksize"]
     siX = cfg["GaussianBlur"]["sigmaX"]
     img_b = cv2.GaussianBlur(img_g, ksize=(ksz, ksz), sigmaX=siX)
+    return img_b
+
+
+##-----------------------------------------------------------------------------
+# Detect edges in a blurred grayscale image, the second step of canny().
+
+# img_b: blurred grayscale image, array [H x W]
+# cfg: configuration dict
+# return: img_c, binary contour map, array [H x W]
+
+
+def canny_edges(img_b, cfg):
     th1 = cfg["Canny"]["threshold1"]
     th2 = cfg["Canny"]["threshold2"]
     img_c = cv2.Canny(img_b, threshold1=th1, threshold2=th2)
-    ys = np.arange(img_c.shape[0])
-    xs = np.arange(img_c.shape[1])
-    fun_c = scipy.interpolate.RegularGridInterpolator(
-        (ys, xs), img_c, method="nearest", bounds_error=True
-    )
-    return (img_c, fun_c)
+    return img_c
 
 
 ##-----------------------------------------------------------------------------
-# Find the first contour point on a radial ray.
+# Detect generic contours only around the given candidates.
 
-# cand: candidate, array [3], (x, y, r)
-# fun_c: function of 2d argument, p in [0, H] x [0, W]
-# ang_deg: radial direction angle, degrees
+# Edge detection runs on the padded search regions of the candidates,
+# see find_contours(); overlapping regions are merged. The padding
+# accounts for the blur kernel and the Canny gradient and suppression
+# windows, so inside the search regions the result matches canny() up to
+# edge hysteresis through pixels outside of all regions.
+
+# img_bgr: color image, array [H x W x 3]
+# cands: list of candidates, array [3], (x, y, r)
 # cfg: configuration dict
-# return: contour point or None
-#   contour point: array [2], (x, y)
+# return: img_c, binary contour map, array [H x W], zero outside the regions
 
 
-def find_radial(cand, fun_c, ang_deg, cfg):
-    min_rel_s = cfg["FindContours"]["minRelScale"]
+def canny_rois(img_bgr, cands, cfg):
     max_rel_s = cfg["FindContours"]["maxRelScale"]
-    (x, y, r) = cand
-    ang_rad = ang_deg * np.pi / 180.0
-
-    # Origin point and radial direction vector.
-    op = np.array([x, y])
-    dv = np.array([np.sin(ang_rad), np.cos(ang_rad)])
-
-    # Radial position and edge functions.
-    def rp(s):
-        return op + s * dv
-
-    def ef(s):
-        return fun_c(np.flip(rp(s)))[0]
-
-    # Find the first contour point on the ray in the valid range.
-    (min_s, max_s) = (min_rel_s * r, max_rel_s * r)
-    for s in np.arange(min_s, max_s, 1.0):
-        try:
-            v = ef(s)
-        except ValueError as e:
-            break
-        if v > 0:
-            return rp(s)
-    return None
+    ksz = cfg["GaussianBlur"]["ksize"]
+    (h, w) = img_bgr.shape[:2]
+    margin = ksz // 2 + 4
+
+    # Padded regions: [x0, y0, x1, y1).
+    rois = []
+    for x, y, r in cands:
+        pad = max_rel_s * r + margin
+        rois.append(
+            [
+                max(int(np.floor(x - pad)), 0),
+                max(int(np.floor(y - pad)), 0),
+                min(int(np.ceil(x + pad)) + 1, w),
+                min(int(np.ceil(y + pad)) + 1, h),
+            ]
+        )
+    rois = merge_rois(rois)
+
+    # Run the edge detection per region, paste into a full-frame map.
+    img_c = np.zeros((h, w), dtype=np.uint8)
+    for x0, y0, x1, y1 in rois:
+        if x1 <= x0 or y1 <= y0:
+            continue
+        img_c[y0:y1, x0:x1] = canny(img_bgr[y0:y1, x0:x1], cfg)
+    return img_c
+
+
+##-----------------------------------------------------------------------------
+# Merge overlapping rectangles.
+
+# rois: list of rectangles, [x0, y0, x1, y1]
+# return: list of non-overlapping rectangles, covering all the input
+
+
+def merge_rois(rois):
+    rois = [list(roi) for roi in rois]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rois)):
+            for j in range(i + 1, len(rois)):
+                (a, b) = (rois[i], rois[j])
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rois[i] = [
+                        min(a[0], b[0]),
+                        min(a[1], b[1]),
+                        max(a[2], b[2]),
+                        max(a[3], b[3]),
+                    ]
+                    del rois[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rois
 
 
 ##-----------------------------------------------------------------------------
 # Find several points on a candidate's contour.
 
 # cand: candidate, array [3], (x, y, r)
-# fun_c: contour indicator function, defined over [0, H] x [0, W]
+# img_c: binary contour map, array [H x W]
 # cfg: configuration dict
 # return: list of contour points,
 #   contour point: array [2], (x, y)
 
 
-def find_contour(cand, fun_c, cfg):
+def find_contour(cand, img_c, cfg):
+    return find_contours([cand], img_c, cfg)[0]
+
+
+##-----------------------------------------------------------------------------
+# Find contour points of many candidates at once.
+
+# For each candidate, radial rays are cast at equidistant angles, and
+# sampled with a 1 px step in [minRelScale * r, maxRelScale * r). The
+# first sample on a contour gives the contour point; a ray stops without
+# a point when it leaves the image. All (candidate, angle, step) samples
+# are evaluated as one array.
+
+# cands: list of candidates, array [3], (x, y, r)
+# img_c: binary contour map, array [H x W]
+# cfg: configuration dict
+# return: list of contours, one per candidate,
+#   contour: list of contour points, array [2], (x, y)
+
+
+def find_contours(cands, img_c, cfg):
     num_points = cfg["FindContours"]["points"]
-    angs = np.linspace(0.0, 360.0, num_points)
-    cont = []
-    for ang_deg in angs:
-        pt = find_radial(cand, fun_c, ang_deg, cfg)
-        if pt is None:
-            continue
-        cont.append(pt)
-    return cont
+    min_rel_s = cfg["FindContours"]["minRelScale"]
+    max_rel_s = cfg["FindContours"]["maxRelScale"]
+    if len(cands) == 0:
+        return []
+    (h, w) = img_c.shape[:2]
+
+    # Radial direction vectors, array [A x 2].
+    ang_rad = np.linspace(0.0, 360.0, num_points) * np.pi / 180.0
+    dv = np.stack([np.sin(ang_rad), np.cos(ang_rad)], axis=1)
+
+    # Radial positions of the samples, padded to the longest ray.
+    steps = []
+    for x, y, r in cands:
+        steps.append(np.arange(min_rel_s * r, max_rel_s * r, 1.0))
+    num_steps = max(len(s) for s in steps)
+    if num_steps == 0:
+        return [[] for _ in cands]
+    ss = np.zeros((len(cands), num_steps))
+    used = np.zeros((len(cands), num_steps), dtype=bool)
+    for k, s in enumerate(steps):
+        ss[k, : len(s)] = s
+        used[k, : len(s)] = True
+
+    # Sample points, array [C x A x S x 2], (x, y).
+    ops = np.array([[x, y] for (x, y, r) in cands], dtype=float)
+    pts = ops[:, None, None, :] + ss[:, None, :, None] * dv[None, :, None, :]
+    (xs, ys) = (pts[..., 0], pts[..., 1])
+
+    # A ray is alive until its first sample outside of the image.
+    inside = (xs >= 0) & (xs <= w - 1) & (ys >= 0) & (ys <= h - 1)
+    alive = np.logical_and.accumulate(inside & used[:, None, :], axis=2)
+
+    # Nearest pixel, ties rounded down.
+    cols = np.where(alive, np.ceil(xs - 0.5), 0).astype(np.intp)
+    rows = np.where(alive, np.ceil(ys - 0.5), 0).astype(np.intp)
+    hits = alive & (img_c[rows, cols] > 0)
+
+    # The first hit on each ray.
+    first = np.argmax(hits, axis=2)
+    found = np.take_along_axis(hits, first[..., None], axis=2)[..., 0]
+    conts = []
+    for k in range(len(cands)):
+        angs = np.flatnonzero(found[k])
+        conts.append([pts[k, a, first[k, a]] for a in angs])
+    return conts
 
 
 ##-----------------------------------------------------------------------------
@@ -140,7 +249,7 @@ def valid_contour(cont, cfg):
 # cand: candidate, array [3], (x, y, r)
 # cont: list of contour points,
 #   contour point: array [2], (x, y)
-# cam: dict of camera parameters
+# cam: dict of camera parameters, or CameraModel
 # cfg: configuration dict
 # return: cone, list of view rays, 0-th: center, rest: contour points,
 #   view ray: (o, r),
@@ -149,31 +258,49 @@ def valid_contour(cont, cfg):
 
 
 def find_cone(cand, cont, cam):
+    return find_cones([cand], [cont], cam)[0]
+
+
+##-----------------------------------------------------------------------------
+# Derive 3D view rays for the contour points of many candidates at once.
+
+# All sensor points of all candidates are inverted in one batched call.
+
+# cands: list of candidates, array [3], (x, y, r)
+# conts: list of contours, one per candidate,
+#   contour: list of contour points, array [2], (x, y)
+# cam: dict of camera parameters, or CameraModel
+# return: list of cones, one per candidate, see find_cone()
 
-    (x, y, r) = cand
 
-    # Extract the intrinsic parameters.
-    imtx = np.array(cam["intrinsics"]["camera_matrix"])
-    dist = np.array(cam["intrinsics"]["distortion_coefficients"])
-    dist = dist.reshape((1, -1))
+def find_cones(cands, conts, cam):
+
+    # Compiled camera model.
+    cam = as_camera_model(cam)
 
     # Common origin of all view rays.
     o = np.array([0.0, 0.0, 0.0])
 
-    # Find a view ray for the candidate's center.
-    q = np.array([[x], [y]])
-    r = cv_view_ray(q, imtx, dist)
-    r = r.flatten()
+    # Stack candidate centers and contour points of all candidates.
+    qs = []
+    for cand, cont in zip(cands, conts):
+        qs.append(np.asarray(cand, dtype=float)[:2].reshape((1, 2)))
+        qs.append(np.asarray(cont, dtype=float).reshape((-1, 2)))
+    if len(qs) == 0:
+        return []
+
+    # Find all view rays in one pass, see CameraModel.view_rays().
+    (rs, _) = cam.view_rays(np.concatenate(qs))
 
-    # Find view rays corresponding to the contour points.
-    cone = [(o, r)]
-    for cx, cy in cont:
-        q = np.array([[cx], [cy]])
-        r = cv_view_ray(q, imtx, dist)
-        r = r.flatten()
-        cone.append((o, r))
+    # Split the rays back into cones: center first, then contour points.
+    cones = []
+    k = 0
+    for cont in conts:
+        n = len(cont) + 1
+        cones.append([(o, r) for r in rs[k : k + n]])
+        k += n
 
-    return cone
+    return cones
 
 
 ##-----------------------------------------------------------------------------
@@ -264,46 +391,238 @@ def fit_ball(cone, radius):
 
 
 ##-----------------------------------------------------------------------------
-# Refine ball center positions using all contour rays.
+# Find approximate 3D positions of many balls, using all contour rays.
 
-# ball: approximate center coordinates in 3D, array [3], (X, Y, Z)
-# cone: list of view rays, 0-th: center, rest: contour points,
-#   view ray: (o, r),
-#     o: array [3], view ray origin point
-#     r: array [3], view ray direction vector
+# The contour rays of a ball form a circular cone around the direction a
+# to the ball center, with the half-angle t: r.a == cos(t) for unit rays
+# r. The vector c = a / cos(t) is the linear least-squares solution of
+# r.c == 1 over all rays; then cos(t) = 1 / |c|, a = c / |c|, and the
+# ball center is at the distance radius / sin(t) from the apex. All
+# rays are assumed to start at the origin of the central ray. Cones
+# which are too narrow or degenerate fall back to fit_ball().
+
+# cones: list of cones, see find_cone()
+# radius: float, a priori known ball radius
+# return: list of approximate ball centers in 3D, array [3], (X, Y, Z)
+
+
+def fit_balls(cones, radius):
+    if len(cones) == 0:
+        return []
+    (ors, rs, used) = stack_cones(cones)
+    w = used[..., None].astype(float)
+
+    # Normal equations of r.c == 1, one 3x3 system per ball.
+    aa = np.einsum("bmi,bmj->bij", w * rs, rs)
+    bb = np.sum(w * rs, axis=1)
+    cc = np.einsum("bij,bj->bi", np.linalg.pinv(aa), bb)
+    cn = np.linalg.norm(cc, axis=1)
+
+    balls = []
+    for k, cone in enumerate(cones):
+        if np.count_nonzero(used[k]) < 3 or not cn[k] > 1.0 + 1.0e-12:
+            balls.append(fit_ball(cone, radius))
+            continue
+        cos_t = 1.0 / cn[k]
+        sin_t = np.sqrt(1.0 - cos_t**2)
+        (oc, _) = cone[0]
+        balls.append(np.array(oc) + (radius / sin_t) * cc[k] / cn[k])
+    return balls
+
+
+##-----------------------------------------------------------------------------
+# Find 3D positions of many balls from conics fitted to their contours.
+
+# The view rays x = (x, y, 1) tangent to a ball with the center p form
+# the cone x^T M x == 0, M = p p^T - (|p|^2 - radius^2) I, so the contour
+# on the z = 1 plane is a conic. The conic is fitted algebraically to the
+# (already undistorted) contour rays; its matrix equals M up to a factor.
+# M has the eigenvalue radius^2 for the direction of p, and a double
+# eigenvalue -(|p|^2 - radius^2); their ratio gives |p|. No iterations
+# are needed, at the cost of some accuracy against refine_balls().
+# All rays are assumed to start at the origin of the central ray.
+# Contours which do not fit an ellipse fall back to fit_balls().
+
+# cones: list of cones, see find_cone()
+# radius: float, a priori known ball radius
+# return: list of ball centers in 3D, array [3], (X, Y, Z)
+
+
+def fit_balls_conic(cones, radius):
+    if len(cones) == 0:
+        return []
+    (ors, rs, used) = stack_cones(cones)
+    w = used.astype(float)
+
+    # Contour points on the z = 1 plane, normalized per ball.
+    (xs, ys) = (rs[..., 0] / rs[..., 2], rs[..., 1] / rs[..., 2])
+    num = np.maximum(w.sum(axis=1), 1.0)
+    (mx, my) = ((w * xs).sum(axis=1) / num, (w * ys).sum(axis=1) / num)
+    sc = np.sqrt((w * ((xs - mx[:, None]) ** 2 + (ys - my[:, None]) ** 2)).sum(1) / num)
+    sc = np.where(sc > 0, sc, 1.0)
+    xn = (xs - mx[:, None]) / sc[:, None]
+    yn = (ys - my[:, None]) / sc[:, None]
+
+    # Algebraic fit: a x^2 + b xy + c y^2 + d x + e y + f == 0, |abcdef| == 1.
+    dd = np.stack([xn**2, xn * yn, yn**2, xn, yn, np.ones_like(xn)], axis=2)
+    dd = dd * w[..., None]
+    (_, vecs) = np.linalg.eigh(np.einsum("bmi,bmj->bij", dd, dd))
+    (a, b, c, d, e, f) = np.moveaxis(vecs[:, :, 0], 1, 0)
+    cn = np.stack(
+        [
+            np.stack([a, b / 2, d / 2], axis=1),
+            np.stack([b / 2, c, e / 2], axis=1),
+            np.stack([d / 2, e / 2, f], axis=1),
+        ],
+        axis=1,
+    )
+
+    # Undo the normalization: x_n = T x, M = T^T M_n T.
+    tt = np.zeros((len(cones), 3, 3))
+    tt[:, 0, 0] = tt[:, 1, 1] = 1.0 / sc
+    tt[:, 0, 2] = -mx / sc
+    tt[:, 1, 2] = -my / sc
+    tt[:, 2, 2] = 1.0
+    mm = np.einsum("bji,bjk,bkl->bil", tt, cn, tt)
+
+    # Eigen decomposition: one eigenvalue differs in sign from the others.
+    (vals, vecs) = np.linalg.eigh(mm)
+    fallback = fit_balls(cones, radius)
+    balls = []
+    for k, cone in enumerate(cones):
+        pos = vals[k] > 0
+        if np.count_nonzero(pos) == 1:
+            i = int(np.flatnonzero(pos)[0])
+        elif np.count_nonzero(pos) == 2:
+            i = int(np.flatnonzero(~pos)[0])
+        else:
+            balls.append(fallback[k])
+            continue
+        l1 = vals[k, i]
+        l2 = 0.5 * (np.sum(vals[k]) - l1)
+        if np.count_nonzero(used[k]) < 5 or not l2 / l1 < 0:
+            balls.append(fallback[k])
+            continue
+        v = vecs[k, :, i] * np.sign(vecs[k, 2, i])
+        (oc, _) = cone[0]
+        balls.append(np.array(oc) + radius * np.sqrt(1.0 - l2 / l1) * v)
+    return balls
+
+
+##-----------------------------------------------------------------------------
+# Stack the contour rays of many cones into padded arrays.
+
+# cones: list of cones, see find_cone()
+# return: (ors, rs, used)
+#   ors: array [B x M x 3], ray origin points
+#   rs: array [B x M x 3], unit ray direction vectors
+#   used: array [B x M] of bool, False for padding
+#   (B: number of cones, M: maximal number of contour rays)
+
+
+def stack_cones(cones):
+    num_rays = max([len(cone) - 1 for cone in cones] + [1])
+    ors = np.zeros((len(cones), num_rays, 3))
+    rs = np.zeros((len(cones), num_rays, 3))
+    rs[..., 2] = 1.0
+    used = np.zeros((len(cones), num_rays), dtype=bool)
+    for k, cone in enumerate(cones):
+        n = len(cone) - 1
+        if n < 1:
+            continue
+        ors[k, :n] = [o for (o, r) in cone[1:]]
+        rs[k, :n] = [r for (o, r) in cone[1:]]
+        used[k, :n] = True
+    rs /= np.linalg.norm(rs, axis=2, keepdims=True)
+    return (ors, rs, used)
+
+
+##-----------------------------------------------------------------------------
+# Refine the center positions of many balls at once.
+
+# Minimizes the discrepancies between the ray-center distances and the
+# ball's radius over all contour rays (the central ray is neglected).
+# Levenberg-Marquardt iterations on the analytic Jacobian, for all balls
+# together; each ball keeps its own damping and stops on its own, with
+# the MINPACK-like tolerances of scipy.optimize.least_squares(method="lm").
+
+# balls: list of approximate centers in 3D, array [3], (X, Y, Z)
+# cones: list of cones, one per ball, see find_cone()
 # radius: float, a priori known ball radius
 # cfg: configuration dict
-# return: refined ball center in 3D, array [3], (X, Y, Z)
+# max_iter: maximal number of iterations
+# ftol, xtol: relative tolerances of the cost and of the step
+# return: list of refined ball centers in 3D, array [3], (X, Y, Z)
+
+
+def refine_balls(balls, cones, radius, cfg, max_iter=100, ftol=1.0e-8, xtol=1.0e-8):
+    if len(balls) == 0:
+        return []
+    (ors, rs, used) = stack_cones(cones)
+    ps = np.array(balls, dtype=float).reshape((-1, 3))
+
+    (e, j) = ray_residuals(ps, ors, rs, used, radius)
+    cost = np.sum(e**2, axis=1)
+    lam = np.full(len(ps), 1.0e-3)
+    active = np.ones(len(ps), dtype=bool)
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
 
+        # Damped normal equations, one 3x3 system per ball.
+        jj = np.einsum("bmi,bmj->bij", j[idx], j[idx])
+        je = np.einsum("bmi,bm->bi", j[idx], e[idx])
+        dg = np.einsum("bii->bi", jj) + 1.0e-12
+        aa = jj + lam[idx, None, None] * (dg[:, :, None] * np.eye(3))
+        dp = -np.linalg.solve(aa, je[..., None])[..., 0]
+
+        # Accept the steps which reduce the cost.
+        pt = ps[idx] + dp
+        (et, jt) = ray_residuals(pt, ors[idx], rs[idx], used[idx], radius)
+        ct = np.sum(et**2, axis=1)
+        ok = ct < cost[idx]
+        acc = idx[ok]
+        small_f = (cost[acc] - ct[ok]) <= ftol * cost[acc]
+        ps[acc] = pt[ok]
+        e[acc] = et[ok]
+        j[acc] = jt[ok]
+        cost[acc] = ct[ok]
+        lam[acc] *= 0.1
+        lam[idx[~ok]] *= 10.0
+
+        # Stop on small steps, small cost reduction, or hopeless damping.
+        step = np.linalg.norm(dp, axis=1)
+        small_x = step <= xtol * (xtol + np.linalg.norm(ps[idx], axis=1))
+        done = small_x | (lam[idx] > 1.0e16)
+        done[ok] |= small_f
+        active[idx[done]] = False
+
+    return list(ps)
 
-def refine_ball(ball, cone, radius, cfg):
 
-    # We neglect the central view ray.
-    num_rays = len(cone) - 1
+##-----------------------------------------------------------------------------
+# Ray-to-center distances minus radius, with the analytic Jacobian.
 
-    # Aux function: distance between a ray and a point.
-    # o: array [3], ray origin point
-    # r: array [3], direction vector of the ray
-    # p: array [3], point in 3D
-    # return: scalar distance
-    def rpdist(o, r, p):
-        u = o - p
-        a = -np.dot(u, r) / np.dot(r, r)
-        d = u + a * r
-        return np.sqrt(np.dot(d, d))
+# The distance vector is d = (o - p) - [(o - p).r] r, so the gradient of
+# |d| in p is -d / |d|.
 
-    # Aux function: discrepancies between the ray-point
-    # distances and the ball's radius for the cone
-    # p: array [3], point in 3D
-    def errf(p):
-        e = [rpdist(o, r, p) - radius for (o, r) in cone[1:]]
-        return np.array(e)
+# ps: array [B x 3], ball centers
+# ors, rs, used: stacked rays, see stack_cones()
+# radius: float, a priori known ball radius
+# return: (e, j)
+#   e: array [B x M], residuals, zero for padding
+#   j: array [B x M x 3], derivatives of the residuals in the centers
 
-    # Find the point that minimizes the discrepancies.
-    res = scipy.optimize.least_squares(errf, ball, method="lm")
-    ball_r = res.x
 
-    return ball_r
+def ray_residuals(ps, ors, rs, used, radius):
+    u = ors - ps[:, None, :]
+    d = u - np.sum(u * rs, axis=2, keepdims=True) * rs
+    dn = np.linalg.norm(d, axis=2)
+    e = np.where(used, dn - radius, 0.0)
+    j = -d / np.where(dn > 0, dn, 1.0)[..., None]
+    j = np.where(used[..., None], j, 0.0)
+    return (e, j)
 
 
 ##-----------------------------------------------------------------------------
@@ -312,23 +631,116 @@ def refine_ball(ball, cone, radius, cfg):
 # ball: center coordinates in 3D, array [3], (X, Y, Z)
 # cand: candidate, array [3], (x, y, r)
 # radius: float, a priori known ball radius
-# cam: dict of camera parameters
+# cam: dict of camera parameters, or CameraModel
 # cfg: configuration dict
 # return: projection of the ball's center, array [2], (x, y)
 
 
 def project_center(ball, cand, radius, cam):
 
-    # Extract the intrinsic parameters.
-    imtx = np.array(cam["intrinsics"]["camera_matrix"])
-    dist = np.array(cam["intrinsics"]["distortion_coefficients"])
-    dist = dist.reshape((1, -1))
+    # Compiled camera model.
+    cam = as_camera_model(cam)
 
-    p = ball.reshape((3, 1))
-    q = cv_project(p, imtx, dist).flatten()
+    p = ball.reshape((1, 3))
+    q = cam.project(p)[0]
     return q
 
 
+##-----------------------------------------------------------------------------
+# Sample the points where the view rays touch a ball.
+
+# ball: center coordinates in 3D, array [3], (X, Y, Z), outside the ball
+# radius: float, a priori known ball radius
+# num_points: number of points
+# return: array [num_points x 3], (X, Y, Z) rows, a closed outline
+
+
+def outline_points(ball, radius, num_points):
+
+    # Direction to the center and the half-angle of the tangent cone.
+    dist = np.linalg.norm(ball)
+    a = ball / dist
+    sin_t = radius / dist
+    cos_t = np.sqrt(1.0 - sin_t * sin_t)
+
+    # Orthonormal basis (e1, e2) perpendicular to a.
+    h = np.eye(3)[np.argmin(np.abs(a))]
+    e1 = np.cross(a, h)
+    e1 /= np.linalg.norm(e1)
+    e2 = np.cross(a, e1)
+
+    # Tangent rays, scaled to the touching points.
+    angs = np.linspace(0.0, 2 * np.pi, num_points, endpoint=False)
+    ds = cos_t * a + sin_t * (np.outer(np.cos(angs), e1) + np.outer(np.sin(angs), e2))
+    ps = dist * cos_t * ds
+
+    return ps
+
+
+##-----------------------------------------------------------------------------
+# Sample the center and three great circles of a ball.
+
+# ball: center coordinates in 3D, array [3], (X, Y, Z)
+# radius: float, a priori known ball radius
+# num_points: number of points per circle
+# return: array [3 * num_points + 4 x 3], (X, Y, Z) rows, the center
+#   followed by the circles parallel to the x-, y- and z-plane, each
+#   closed at the center
+
+
+def cut_points(ball, radius, num_points):
+
+    # Pre-compute several points on a circle.
+    angs = np.linspace(0.0, 2 * np.pi, num_points)
+    us = radius * np.sin(angs)
+    vs = radius * np.cos(angs)
+
+    # Offsets of the three cuts, parallel to the x-, y- and z-plane.
+    zs = np.zeros_like(angs)
+    cuts = [
+        np.stack([zs, us, vs], axis=1),
+        np.stack([us, zs, vs], axis=1),
+        np.stack([us, vs, zs], axis=1),
+    ]
+
+    # Stack the center and the cuts, closing each cut at the center.
+    offs = [np.zeros((1, 3))]
+    for cut in cuts:
+        offs.append(cut)
+        offs.append(np.zeros((1, 3)))
+    ps = ball.reshape((1, 3)) + np.concatenate(offs)
+
+    return ps
+
+
+##-----------------------------------------------------------------------------
+# Sample the 3D points of a ball's re-projected contour.
+
+# In the "OUTLINE" mode the true silhouette is sampled: the view rays
+# tangent to the ball form a cone around the direction a to the center,
+# with the half-angle t, sin(t) == radius / |ball|. Its rays
+# d = cos(t) a + sin(t) (cos(f) e1 + sin(f) e2) touch the ball at the
+# distance |ball| cos(t). The "CUTS" mode shows the center and three
+# great circles parallel to the x-, y- and z-plane instead.
+
+# ball: center coordinates in 3D, array [3], (X, Y, Z)
+# radius: float, a priori known ball radius
+# cfg: configuration dict
+# return: array [n x 3], (X, Y, Z) rows
+
+
+def contour_points(ball, radius, cfg):
+
+    # Number of points to project.
+    num_points = cfg["ShowTargets"]["points"]
+
+    # Distance to the ball; the outline exists only outside of it.
+    dist = np.linalg.norm(ball)
+    if cfg["ShowTargets"]["mode"] == "OUTLINE" and dist > radius:
+        return outline_points(ball, radius, num_points)
+    return cut_points(ball, radius, num_points)
+
+
 ##-----------------------------------------------------------------------------
 # Re-project a ball's contour back onto the sensor.
 
@@ -336,51 +748,21 @@ def project_center(ball, cand, radius, cam):
 # cont: list of found contour points,
 #   contour point: array [2], (x, y)
 # radius: float, a priori known ball radius
-# cam: dict of camera parameters
+# cam: dict of camera parameters, or CameraModel
 # cfg: configuration dict
-# return: list of refined contour points,
+# return: list of refined contour points, see contour_points(),
 #   contour point: array [2], (x, y)
 
 
 def project_contour(ball, cont, radius, cam, cfg):
 
-    # Number of points to project.
-    num_points = cfg["ShowTargets"]["points"]
-
-    # Extract the intrinsic parameters.
-    imtx = np.array(cam["intrinsics"]["camera_matrix"])
-    dist = np.array(cam["intrinsics"]["distortion_coefficients"])
-    dist = dist.reshape((1, -1))
-
-    # Pre-compute several points on a circle.
-    angs = np.linspace(0.0, 2 * np.pi, num_points)
-    us = radius * np.sin(angs)
-    vs = radius * np.cos(angs)
+    # Compiled camera model.
+    cam = as_camera_model(cam)
 
-    cont_r = []
-    ctr = cv_project(ball, imtx, dist).flatten()
-    cont_r.append(ctr)
-
-    # Cut parallel to the x-plane.
-    for u, v in zip(us, vs):
-        p = (ball + np.array([0, u, v])).reshape((3, 1))
-        q = cv_project(p, imtx, dist).flatten()
-        cont_r.append(q)
-    cont_r.append(ctr)
-
-    # Cut parallel to the y-plane.
-    for u, v in zip(us, vs):
-        p = (ball + np.array([u, 0, v])).reshape((3, 1))
-        q = cv_project(p, imtx, dist).flatten()
-        cont_r.append(q)
-    cont_r.append(ctr)
-
-    # Cut parallel to the z-plane.
-    for u, v in zip(us, vs):
-        p = (ball + np.array([u, v, 0])).reshape((3, 1))
-        q = cv_project(p, imtx, dist).flatten()
-        cont_r.append(q)
-    cont_r.append(ctr)
+    # Project all points in one pass.
+    ps = contour_points(ball, radius, cfg)
+    qs = cam.project(ps)
+    cont_r = list(qs)
 
     return cont_r
 
@@ -36,21 +36,33 @@ def init_yolo(model_name):
 
 
 ##-----------------------------------------------------------------------------
-# Find spheres in the image using a pre-trained YOLO model.
+# Run a pre-trained YOLO model on the image.
 
 # img_bgr: color image, array [H x W x 3]
-# return: list of candidates
-#   each candidate: array [3], (x, y, r)
+# return: YOLO results of the image, or None if there are none
 
 
-def detect_yolo(yolo, img_bgr, cfg):
+def run_yolo(yolo, img_bgr, cfg):
     class_id = cfg["YOLO"]["classId"]
     min_conf = cfg["YOLO"]["minConfidence"]
-    res = yolo(img_bgr, classes=[class_id], conf=min_conf, verbose=False)
+    imgsz = cfg["YOLO"]["imgsz"]
+    res = yolo(img_bgr, classes=[class_id], conf=min_conf, imgsz=imgsz, verbose=False)
     if len(res) < 1:
-        return []
+        return None
+    return res[0]
+
+
+##-----------------------------------------------------------------------------
+# Convert YOLO bounding boxes to candidates.
+
+# res: YOLO results of an image
+# return: list of candidates
+#   each candidate: array [3], (x, y, r)
+
+
+def boxes_to_cands(res):
     cands = []
-    boxes = np.array(res[0].boxes.xyxy.cpu())
+    boxes = np.array(res.boxes.xyxy.cpu())
     for i in range(boxes.shape[0]):
         (xa, ya, xb, yb) = boxes[i, :]
         (x, y) = (0.5 * (xa + xb), 0.5 * (ya + yb))
@@ -59,4 +71,51 @@ def detect_yolo(yolo, img_bgr, cfg):
     return cands
 
 
+##-----------------------------------------------------------------------------
+# Find spheres in the image using a pre-trained YOLO model.
+
+# img_bgr: color image, array [H x W x 3]
+# return: list of candidates
+#   each candidate: array [3], (x, y, r)
+
+
+def detect_yolo(yolo, img_bgr, cfg):
+    res = run_yolo(yolo, img_bgr, cfg)
+    if res is None:
+        return []
+    return boxes_to_cands(res)
+
+
+##-----------------------------------------------------------------------------
+# Find spheres and their contours using a YOLO segmentation model.
+
+# The contours are taken from the outlines of the segmentation masks,
+# evenly thinned out to at most FindContours.points points.
+
+# img_bgr: color image, array [H x W x 3]
+# return: (cands, conts)
+#   cands: list of candidates, array [3], (x, y, r)
+#   conts: list of contours, one per candidate, or None if the model
+#     provides no segmentation masks,
+#     contour: list of contour points, array [2], (x, y)
+
+
+def detect_yolo_contours(yolo, img_bgr, cfg):
+    num_points = cfg["FindContours"]["points"]
+    res = run_yolo(yolo, img_bgr, cfg)
+    if res is None:
+        return ([], [])
+    cands = boxes_to_cands(res)
+    if res.masks is None:
+        return (cands, None)
+    conts = []
+    for poly in res.masks.xy:
+        poly = np.asarray(poly, dtype=float)
+        if poly.shape[0] > num_points:
+            idx = np.linspace(0, poly.shape[0], num_points, endpoint=False)
+            poly = poly[idx.astype(int)]
+        conts.append(list(poly))
+    return (cands, conts)
+
+
 ##-----------------------------------------------------------------------------
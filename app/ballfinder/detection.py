@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+##
+## Description: Detection results with lazily re-projected 2D fields.
+#############################################################################
+
+
+from .cammodel import as_camera_model
+from .det_util import project_center, project_contour
+
+
+class Detection(dict):
+
+    # Keys computed on first access.
+    LAZY_KEYS = ("2d_center", "2d_contour")
+
+    ##---------------------------------------------------------------------------
+    # Initialize a detection.
+
+    # Only 'target' and 'candidate' are stored; '2d_center' and '2d_contour'
+    # are re-projected on first access with [] (or by project()) and kept.
+    # Note that get(), 'in' and iteration see only the fields present.
+
+    # ball: center coordinates in 3D, array [3], (X, Y, Z)
+    # cand: candidate, tuple (x, y, r)
+    # cont: list of found contour points, array [2], (x, y)
+    # radius: float, a priori known ball radius
+    # camera: CameraModel
+    # cfg: configuration dict
+
+    def __init__(self, ball, cand, cont, radius, camera, cfg):
+        (x, y, r) = cand
+        (X, Y, Z) = ball
+        dict.__init__(self, target=(X, Y, Z, radius), candidate=(x, y, r))
+        self.__source = (ball, cont, radius, camera, cfg)
+
+    def __missing__(self, key):
+        if key not in self.LAZY_KEYS:
+            raise KeyError(key)
+        self.project()
+        return dict.__getitem__(self, key)
+
+    ##---------------------------------------------------------------------------
+    # Compute the re-projected 2D fields, if not done yet.
+
+    def project(self):
+        if self.__source is None:
+            return
+        (ball, cont, radius, camera, cfg) = self.__source
+        camera = as_camera_model(camera)
+        (a, b) = project_center(ball, self["candidate"], radius, camera)
+        cont_r = project_contour(ball, cont, radius, camera, cfg)
+        self["2d_center"] = (a, b)
+        self["2d_contour"] = [(x, y) for (x, y) in cont_r]
+        self.__source = None
+
+
+##-----------------------------------------------------------------------------
+# Compute the re-projected 2D fields of detections, before rendering.
+
+# res: list of detections, see BallFinder.find_balls()
+# return: res
+
+
+def project_detections(res):
+    for det in res:
+        if isinstance(det, Detection):
+            det.project()
+    return res
+
+
+##-----------------------------------------------------------------------------
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+##
+## Description: Columnar table of the detections of many frames.
+#############################################################################
+
+
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from .cammodel import as_camera_model
+from .det_util import contour_points
+
+
+# One row per ball, sorted by frame.
+ROW_DTYPE = np.dtype(
+    [
+        ("frame", np.int32),
+        ("ball", np.int16),
+        ("target", np.float64, 3),
+        ("radius", np.float64),
+        ("candidate", np.float64, 3),
+    ]
+)
+
+# Columns, stored as <path>.<name>.npy
+COLUMNS = ("rows",)
+
+
+class DetectionTable(Mapping):
+
+    ##---------------------------------------------------------------------------
+    # Initialize a table.
+
+    # Read as {frame number: list of detections}; the detections are
+    # DetectionView rows with the keys of a Detection. Frames without
+    # balls read as []. Assigned frames override the table.
+
+    # As with Detection, the 2D centers and contours are re-projected
+    # lazily: the rows of a frame together, on the first access to one.
+
+    # rows: array [n] of ROW_DTYPE, sorted by frame
+    # camera: dict of camera parameters, or CameraModel
+    # cfg: configuration dict
+
+    def __init__(self, rows, camera, cfg):
+        self.rows = rows
+        self.camera = as_camera_model(camera)
+        self.cfg = cfg
+        self.__overrides = {}
+        self.__projected = {}
+
+    ##---------------------------------------------------------------------------
+    # Detections of a frame.
+
+    # i: frame number
+    # return: list of detections
+
+    def __getitem__(self, i):
+        if i in self.__overrides:
+            return self.__overrides[i]
+        frames = self.rows["frame"]
+        lo = np.searchsorted(frames, i, side="left")
+        hi = np.searchsorted(frames, i, side="right")
+        return [DetectionView(self, k) for k in range(lo, hi)]
+
+    def __setitem__(self, i, res):
+        self.__overrides[i] = res
+
+    def __contains__(self, i):
+        return i in self.__overrides or len(self[i]) > 0
+
+    def __iter__(self):
+        return iter(sorted(self.__frames()))
+
+    def __len__(self):
+        return len(self.__frames())
+
+    def __frames(self):
+        return set(np.unique(self.rows["frame"]).tolist()) | set(self.__overrides)
+
+    ##---------------------------------------------------------------------------
+    # Re-projected 2D fields of a row.
+
+    # k: row index
+    # return: (center, contour)
+    #   center: array [2], (x, y)
+    #   contour: array [m x 2], (x, y) rows
+
+    def projection(self, k):
+        frames = self.rows["frame"]
+        i = int(frames[k])
+        if i not in self.__projected:
+            lo = np.searchsorted(frames, i, side="left")
+            hi = np.searchsorted(frames, i, side="right")
+            self.__projected[i] = (lo,) + self.__project(lo, hi)
+        (lo, centers, contours) = self.__projected[i]
+        return (centers[k - lo], contours[k - lo])
+
+    def __project(self, lo, hi):
+        rows = self.rows[lo:hi]
+        balls = np.asarray(rows["target"], dtype=float)
+        centers = self.camera.project(balls)
+
+        # All contour points of the frame in one pass.
+        ps = [
+            contour_points(ball, float(radius), self.cfg)
+            for (ball, radius) in zip(balls, rows["radius"])
+        ]
+        points = self.camera.project(np.concatenate(ps)).astype(np.float32)
+        offsets = np.cumsum([len(p) for p in ps])[:-1]
+        return (centers, np.split(points, offsets))
+
+    ##---------------------------------------------------------------------------
+    # Memory size of the columns.
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes
+
+    ##---------------------------------------------------------------------------
+    # Write the columns to <path>.<column>.npy; overrides are not saved.
+
+    # path: string, path without extension
+
+    def save(self, path):
+        for name in COLUMNS:
+            tmp = f"{path}.{name}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp, f"{path}.{name}.npy")
+
+    ##---------------------------------------------------------------------------
+    # Read a table written by save().
+
+    # path: string, path without extension
+    # camera: dict of camera parameters, or CameraModel
+    # cfg: configuration dict
+    # mmap: bool, map the columns instead of reading them into memory
+    # return: DetectionTable
+
+    @staticmethod
+    def load(path, camera, cfg, mmap=True):
+        mode = "r" if mmap else None
+        columns = [np.load(f"{path}.{name}.npy", mmap_mode=mode) for name in COLUMNS]
+        return DetectionTable(*columns, camera, cfg)
+
+
+class DetectionView(Mapping):
+
+    # Keys of a detection, see BallFinder.find_balls()
+    KEYS = ("target", "candidate", "2d_center", "2d_contour")
+
+    ##---------------------------------------------------------------------------
+    # Initialize a view of one table row.
+
+    # table: DetectionTable
+    # k: row index
+
+    def __init__(self, table, k):
+        self.table = table
+        self.k = k
+
+    def __getitem__(self, key):
+        row = self.table.rows[self.k]
+        if key == "target":
+            return tuple(row["target"].tolist()) + (float(row["radius"]),)
+        if key == "candidate":
+            return tuple(row["candidate"].tolist())
+        if key == "2d_center":
+            return tuple(self.table.projection(self.k)[0].tolist())
+        if key == "2d_contour":
+            return self.table.projection(self.k)[1]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __eq__(self, other):
+        if isinstance(other, DetectionView):
+            return self.table is other.table and self.k == other.k
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self.table), self.k))
+
+    def __repr__(self):
+        return f"DetectionView({self['target']}, {self['candidate']})"
+
+
+##-----------------------------------------------------------------------------
+# Build the table of located balls; see DetectionTable for the 2D fields.
+
+# frames: iterable of (frame number, cands, balls),
+#   cands: list of candidates, tuple (x, y, r)
+#   balls: list of center coordinates in 3D, array [3], (X, Y, Z)
+# radius: float, a priori known ball radius
+# camera: dict of camera parameters, or CameraModel
+# cfg: configuration dict
+# return: DetectionTable
+
+
+def build_table(frames, radius, camera, cfg):
+
+    # Flatten the frames, in frame order.
+    items = [
+        (i, k, cand, ball)
+        for (i, cands, balls) in sorted(frames, key=lambda f: f[0])
+        for (k, (cand, ball)) in enumerate(zip(cands, balls))
+    ]
+    rows = np.zeros(len(items), dtype=ROW_DTYPE)
+    if not items:
+        return DetectionTable(rows, camera, cfg)
+
+    (numbers, ks, cands, balls) = zip(*items)
+    rows["frame"] = numbers
+    rows["ball"] = ks
+    rows["target"] = np.array(balls, dtype=float).reshape((-1, 3))
+    rows["radius"] = radius
+    rows["candidate"] = np.array(cands, dtype=float).reshape((-1, 3))
+
+    return DetectionTable(rows, camera, cfg)
+
+
+##-----------------------------------------------------------------------------
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+##
+## Description: Opt-in timing of the detection stages.
+#############################################################################
+
+
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+
+class Instrument(object):
+
+    ##---------------------------------------------------------------------------
+    # Initialize the instrumentation.
+
+    # Each stage keeps its last `window` samples of wall-clock and CPU
+    # time (time.perf_counter() and time.thread_time(), seconds); each
+    # counter keeps its last `window` values.
+
+    # window: number of samples for the rolling statistics
+
+    def __init__(self, window=100):
+        self.window = window
+        self.times = {}
+        self.counts = {}
+        self.frames = 0
+
+    ##---------------------------------------------------------------------------
+    # Measure a stage: with instr.stage("edges"): ...
+
+    # name: stage name
+
+    @contextmanager
+    def stage(self, name):
+        (t0, c0) = (time.perf_counter(), time.thread_time())
+        try:
+            yield
+        finally:
+            (t1, c1) = (time.perf_counter(), time.thread_time())
+            if name not in self.times:
+                self.times[name] = deque(maxlen=self.window)
+            self.times[name].append((t1 - t0, c1 - c0))
+
+    ##---------------------------------------------------------------------------
+    # Record a count, e.g. of candidates in a frame.
+
+    # name: counter name
+    # value: int
+
+    def count(self, name, value):
+        if name not in self.counts:
+            self.counts[name] = deque(maxlen=self.window)
+        self.counts[name].append(value)
+
+    ##---------------------------------------------------------------------------
+    # Mark the end of a frame.
+
+    def end_frame(self):
+        self.frames += 1
+
+    ##---------------------------------------------------------------------------
+    # Rolling percentiles of all stages and counters.
+
+    # qs: percentiles to compute, 0 to 100
+    # return: dict, {
+    #     'stages': {name: {'wall': [ms, ...], 'cpu': [ms, ...]}},
+    #     'counts': {name: [value, ...]}
+    #   }, one value per percentile
+
+    def percentiles(self, qs=(50, 90, 99)):
+        stages = {}
+        for name, samples in list(self.times.items()):
+            ts = 1e3 * np.array(samples)
+            stages[name] = {
+                "wall": list(np.percentile(ts[:, 0], qs)),
+                "cpu": list(np.percentile(ts[:, 1], qs)),
+            }
+        counts = {}
+        for name, values in list(self.counts.items()):
+            counts[name] = list(np.percentile(np.array(values), qs))
+        return {"stages": stages, "counts": counts}
+
+    ##---------------------------------------------------------------------------
+    # One-line summary of the median and 90th percentile, for logging.
+
+    # return: string
+
+    def summary(self):
+        stats = self.percentiles((50, 90))
+        parts = []
+        for name, st in stats["stages"].items():
+            (w50, w90) = st["wall"]
+            (c50, _) = st["cpu"]
+            parts.append(f"{name} {w50:.1f}/{w90:.1f} ms (cpu {c50:.1f})")
+        for name, (v50, v90) in stats["counts"].items():
+            parts.append(f"{name} {v50:.0f}/{v90:.0f}")
+        num = min(self.frames, self.window)
+        return f"p50/p90 of the last {num} frames: " + ", ".join(parts)
+
+
+class NullInstrument(object):
+
+    ##---------------------------------------------------------------------------
+    # Instrumentation which records nothing, used when it is disabled.
+
+    frames = 0
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def count(self, name, value):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def percentiles(self, qs=(50, 90, 99)):
+        return {"stages": {}, "counts": {}}
+
+    def summary(self):
+        return ""
+
+
+_NULL_STAGE = nullcontext()
+
+
+##-----------------------------------------------------------------------------
@@ -30,6 +30,33 @@ import numpy as np
 import scipy
 
 
+##-----------------------------------------------------------------------------
+# Tilt transformation of the sensor plane (step 4 of the projection model).
+
+# tx, ty: tilt angles, radians
+# return: mm, array [3x3], maps (x'', y'', 1) to s * (x''', y''', 1)
+
+
+def tilt_matrix(tx, ty):
+    (sin_tx, sin_ty) = (np.sin(tx), np.sin(ty))
+    (cos_tx, cos_ty) = (np.cos(tx), np.cos(ty))
+    tm = np.array(
+        [
+            [cos_ty * cos_tx, 0, sin_ty * cos_tx],
+            [0, cos_ty * cos_tx, -sin_tx],
+            [0, 0, 1],
+        ]
+    )
+    rm = np.array(
+        [
+            [cos_ty, sin_ty * sin_tx, -sin_ty * cos_tx],
+            [0, cos_tx, sin_tx],
+            [sin_ty, -cos_ty * sin_tx, cos_ty * cos_tx],
+        ]
+    )
+    return np.matmul(tm, rm)
+
+
 ##-----------------------------------------------------------------------------
 # Core OpenCV projection model.
 
@@ -89,23 +116,7 @@ def cvcore(p, ipar, eps=1.0e-8):
     vpp = np.array([[xpp], [ypp], [1.0]])  # vector (x'', y'', 1)
 
     # Step 4: tilt the image.
-    (sin_tx, sin_ty) = (np.sin(tx), np.sin(ty))
-    (cos_tx, cos_ty) = (np.cos(tx), np.cos(ty))
-    tm = np.array(
-        [
-            [cos_ty * cos_tx, 0, sin_ty * cos_tx],
-            [0, cos_ty * cos_tx, -sin_tx],
-            [0, 0, 1],
-        ]
-    )
-    rm = np.array(
-        [
-            [cos_ty, sin_ty * sin_tx, -sin_ty * cos_tx],
-            [0, cos_tx, sin_tx],
-            [sin_ty, -cos_ty * sin_tx, cos_ty * cos_tx],
-        ]
-    )
-    mm = np.matmul(tm, rm)
+    mm = tilt_matrix(tx, ty)
     vppp = np.matmul(mm, vpp)
     (xu, yu, zu) = (vppp[0, 0], vppp[1, 0], vppp[2, 0])
 
@@ -120,6 +131,120 @@ def cvcore(p, ipar, eps=1.0e-8):
     return q
 
 
+##-----------------------------------------------------------------------------
+# Core OpenCV projection model, vectorized over many points.
+
+# Same model as cvcore(), evaluated for all points in one NumPy pass.
+
+# ps: array [N x 3], (x, y, z) rows, 3D points in the camera's coordinates
+# ipar: array [18], intrinsic camera parameters
+# eps: a sufficiently small number, threshold for inverses
+# return: qs: array [N x 2], (u, v) rows, projections on the camera sensor
+
+
+def cvcore_batch(ps, ipar, eps=1.0e-8):
+    # Extract 3D point components.
+    (x, y, z) = (ps[:, 0], ps[:, 1], ps[:, 2])
+
+    # Extract intrinsic parameters.
+    (fx, fy, cx, cy, k1, k2, p1, p2, k3, k4, k5, k6, s1, s2, s3, s4, tx, ty) = ipar
+
+    # Step 1: calculate x prime (x') and y prime (y').
+    (xp, yp) = (-1.0 * x / z, -1.0 * y / z)
+
+    # Step 2: calculate squared radius r^2.
+    r2 = xp**2 + yp**2
+
+    # Step 3: apply radial and tangential distortions.
+    ffn = 1 + k1 * r2 + k2 * r2**2 + k3 * r2**3  # nominator
+    ffd = 1 + k4 * r2 + k5 * r2**2 + k6 * r2**3  # denominator
+    assert np.all(np.fabs(ffd) > eps)  # sanity check
+    xpp = (
+        xp * ffn / ffd + 2 * p1 * xp * yp + p2 * (r2 + 2 * xp**2) + s1 * r2 + s2 * r2**2
+    )
+    ypp = (
+        yp * ffn / ffd + p1 * (r2 + 2 * yp**2) + 2 * p2 * xp * yp + s3 * r2 + s4 * r2**2
+    )
+
+    # Step 4: tilt the image.
+    mm = tilt_matrix(tx, ty)
+    xu = mm[0, 0] * xpp + mm[0, 1] * ypp + mm[0, 2]
+    yu = mm[1, 0] * xpp + mm[1, 1] * ypp + mm[1, 2]
+    zu = mm[2, 0] * xpp + mm[2, 1] * ypp + mm[2, 2]
+
+    # Step 5: (xu, yu, zu) = s * (x''', y''', 1), recover x''' and y'''.
+    (xppp, yppp) = (xu / zu, yu / zu)
+
+    # Step 6: transform distorted points into u,v image chip coordinates.
+    (u, v) = (fx * xppp + cx, fy * yppp + cy)
+
+    # Pack into the output 2D vectors.
+    qs = np.stack([u, v], axis=1)
+    return qs
+
+
+##-----------------------------------------------------------------------------
+# Projection of points on the z = 1 plane with an analytic Jacobian.
+
+# ws: array [N x 2], (wx, wy) rows, 3D points (wx, wy, 1.0)
+# ipar: array [18], intrinsic camera parameters
+# eps: a sufficiently small number, threshold for inverses
+# return: (qs, jac)
+#   qs: array [N x 2], (u, v) rows, projections on the camera sensor
+#   jac: array [N x 2 x 2], derivatives d(u, v) / d(wx, wy)
+
+
+def cvcore_plane(ws, ipar, eps=1.0e-8):
+    (fx, fy, cx, cy, k1, k2, p1, p2, k3, k4, k5, k6, s1, s2, s3, s4, tx, ty) = ipar
+
+    # Step 1: x' = -wx, y' = -wy for points at z = 1.
+    (xp, yp) = (-1.0 * ws[:, 0], -1.0 * ws[:, 1])
+
+    # Step 2: squared radius and its derivatives.
+    r2 = xp**2 + yp**2
+    (r2_x, r2_y) = (2 * xp, 2 * yp)
+
+    # Step 3: rational radial factor ff = ffn / ffd and its derivative in r^2.
+    ffn = 1 + k1 * r2 + k2 * r2**2 + k3 * r2**3
+    ffd = 1 + k4 * r2 + k5 * r2**2 + k6 * r2**3
+    assert np.all(np.fabs(ffd) > eps)  # sanity check
+    ffn_r = k1 + 2 * k2 * r2 + 3 * k3 * r2**2
+    ffd_r = k4 + 2 * k5 * r2 + 3 * k6 * r2**2
+    ff = ffn / ffd
+    ff_r = (ffn_r * ffd - ffn * ffd_r) / ffd**2
+
+    # Distorted point (x'', y'') and its partial derivatives.
+    sx_r = s1 + 2 * s2 * r2  # thin prism terms, derivative in r^2
+    sy_r = s3 + 2 * s4 * r2
+    xpp = xp * ff + 2 * p1 * xp * yp + p2 * (r2 + 2 * xp**2) + s1 * r2 + s2 * r2**2
+    ypp = yp * ff + p1 * (r2 + 2 * yp**2) + 2 * p2 * xp * yp + s3 * r2 + s4 * r2**2
+    xpp_x = ff + xp * ff_r * r2_x + 2 * p1 * yp + 6 * p2 * xp + sx_r * r2_x
+    xpp_y = xp * ff_r * r2_y + 2 * p1 * xp + 2 * p2 * yp + sx_r * r2_y
+    ypp_x = yp * ff_r * r2_x + 2 * p1 * xp + 2 * p2 * yp + sy_r * r2_x
+    ypp_y = ff + yp * ff_r * r2_y + 6 * p1 * yp + 2 * p2 * xp + sy_r * r2_y
+
+    # Step 4: tilt the image.
+    mm = tilt_matrix(tx, ty)
+    xu = mm[0, 0] * xpp + mm[0, 1] * ypp + mm[0, 2]
+    yu = mm[1, 0] * xpp + mm[1, 1] * ypp + mm[1, 2]
+    zu = mm[2, 0] * xpp + mm[2, 1] * ypp + mm[2, 2]
+
+    # Step 5: perspective division and its derivatives via the quotient rule.
+    (xppp, yppp) = (xu / zu, yu / zu)
+    jac = np.empty((ws.shape[0], 2, 2))
+    for j, (dxpp, dypp) in enumerate([(xpp_x, ypp_x), (xpp_y, ypp_y)]):
+        dxu = mm[0, 0] * dxpp + mm[0, 1] * dypp
+        dyu = mm[1, 0] * dxpp + mm[1, 1] * dypp
+        dzu = mm[2, 0] * dxpp + mm[2, 1] * dypp
+        # Factor (-1): d(x', y') / d(wx, wy) = -I.
+        jac[:, 0, j] = -fx * (dxu * zu - xu * dzu) / zu**2
+        jac[:, 1, j] = -fy * (dyu * zu - yu * dzu) / zu**2
+
+    # Step 6: image chip coordinates.
+    qs = np.stack([fx * xppp + cx, fy * yppp + cy], axis=1)
+    return (qs, jac)
+
+
 ##-----------------------------------------------------------------------------
 # Convert intrinsic parameters from OpenCV format to a flat vector.
 
@@ -183,6 +308,28 @@ def cv_project(p, imtx, dist, eps=1.0e-8):
     return q
 
 
+##-----------------------------------------------------------------------------
+# Project many 3D points to 2D image points at once.
+
+# ps: array [N x 3], (x, y, z) rows, 3D points in the camera's coordinates
+# imtx: array [3x3], intrinsic projection matrix
+# dist: array [1xN], distortion coefficients, N = 4, 5, 8, 12, or 14
+# eps: sufficiently small number, threshold for inverses
+# return: qs, array [N x 2], (u, v) rows, 2D sensor points
+
+
+def cv_project_batch(ps, imtx, dist, eps=1.0e-8):
+
+    # Pack parameters as a fixed-size vector, once for all points.
+    ipar = to_ipar(imtx, dist)
+
+    # Main projection step.
+    pv = np.asarray(ps, dtype=float).reshape((-1, 3))
+    qs = cvcore_batch(pv, ipar, eps)
+
+    return qs
+
+
 ##-----------------------------------------------------------------------------
 # Find view ray direction for a given sensor point.
 
@@ -233,4 +380,86 @@ def cv_view_ray(q, imtx, dist, tolerance=1.0e-3, check_conv=False, eps=1.0e-8):
     return r
 
 
+##-----------------------------------------------------------------------------
+# Find view ray directions for many sensor points at once.
+
+# Vectorized Gauss-Newton iteration on the analytic Jacobian of the
+# projection model with step halving; all points are solved together.
+
+# qs: array [N x 2], (u, v) rows, 2D sensor points
+# imtx: array [3x3], intrinsic projection matrix
+# dist: array [1xN], distortion coefficients, N = 4, 5, 8, 12, or 14
+# tolerance: allowed residual re-projection error
+# check_conv: whether to verify the re-projection convergence
+# max_iter: maximal number of Gauss-Newton iterations
+# max_halving: maximal number of step halvings per iteration
+# xtol: relative step size at which a point is considered solved
+# eps: sufficiently small number, threshold for inverses
+# return: (rs, conv)
+#   rs: array [N x 3], (rx, ry, rz) rows, view ray direction vectors
+#   conv: array [N] of bool, re-projection error is below tolerance
+
+
+def cv_view_rays(
+    qs,
+    imtx,
+    dist,
+    tolerance=1.0e-3,
+    check_conv=False,
+    max_iter=20,
+    max_halving=8,
+    xtol=1.0e-12,
+    eps=1.0e-8,
+):
+
+    # Pack parameters as a fixed-size vector, once for all points.
+    ipar = to_ipar(imtx, dist)
+    (fx, fy, cx, cy) = (ipar[0], ipar[1], ipar[2], ipar[3])
+
+    # Initial guess acc. to linear pinhole model.
+    qs = np.asarray(qs, dtype=float).reshape((-1, 2))
+    ws = np.stack([(qs[:, 0] - cx) / fx, (qs[:, 1] - cy) / fy], axis=1)
+
+    # Gauss-Newton steps; points drop out once their update is negligible.
+    active = np.ones(qs.shape[0], dtype=bool)
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        (qa, jac) = cvcore_plane(ws[idx], ipar, eps)
+        ea = qs[idx] - qa
+        det = jac[:, 0, 0] * jac[:, 1, 1] - jac[:, 0, 1] * jac[:, 1, 0]
+        ok = np.fabs(det) > eps
+        det = np.where(ok, det, 1.0)
+        dwx = (jac[:, 1, 1] * ea[:, 0] - jac[:, 0, 1] * ea[:, 1]) / det
+        dwy = (jac[:, 0, 0] * ea[:, 1] - jac[:, 1, 0] * ea[:, 0]) / det
+        dws = np.where(ok[:, None], np.stack([dwx, dwy], axis=1), 0.0)
+
+        # Halve the steps which do not reduce the re-projection error.
+        err0 = np.linalg.norm(ea, axis=1)
+        for _ in range(max_halving):
+            wt = ws[idx] + dws
+            qt = cvcore_batch(np.concatenate([wt, np.ones((idx.size, 1))], 1), ipar)
+            bad = np.linalg.norm(qs[idx] - qt, axis=1) > err0
+            if not np.any(bad):
+                break
+            dws[bad] *= 0.5
+
+        ws[idx] += dws
+        step = np.fabs(dws).max(axis=1)
+        done = ~ok | (step <= xtol * (1.0 + np.fabs(ws[idx]).max(axis=1)))
+        active[idx[done]] = False
+
+    # Recover the view ray directions.
+    rs = np.concatenate([ws, np.ones((ws.shape[0], 1))], axis=1)
+
+    # Convergence quality, same criterion as in cv_view_ray().
+    err = np.linalg.norm(cvcore_batch(rs, ipar, eps) - qs, axis=1)
+    conv = err < tolerance
+    if check_conv:
+        assert np.all(conv)
+
+    return (rs, conv)
+
+
 ##-----------------------------------------------------------------------------
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+##
+## Description: Pre-computed lookup table of view rays.
+#############################################################################
+
+import json
+import os
+
+import numpy as np
+
+from .ocvcam import cvcore_batch, cv_view_rays, to_ipar
+
+
+class RayLUT(object):
+
+    ##---------------------------------------------------------------------------
+    # Initialize the lookup table.
+
+    # grid: array [Hg x Wg x 2], (wx, wy) of the view ray (wx, wy, 1.0)
+    #   through the sensor point (j * step, i * step), NaN where the
+    #   solver did not converge, may be memory-mapped
+    # step: grid spacing, pixels
+    # error: float, upper bound of the re-projection error of interpolated
+    #   rays, pixels, see build_ray_lut()
+
+    def __init__(self, grid, step, error):
+        self.grid = grid
+        self.step = step
+        self.error = error
+
+    ##---------------------------------------------------------------------------
+    # Look up view rays for sensor points with bilinear interpolation.
+
+    # qs: array [N x 2], (u, v) rows, 2D sensor points
+    # return: (rs, inside)
+    #   rs: array [N x 3], (rx, ry, rz) rows, view ray direction vectors
+    #   inside: array [N] of bool, the point is covered by the grid and
+    #     its cell has no NaN nodes; rays of the other points are
+    #     extrapolated or NaN and must not be used
+
+    def view_rays(self, qs):
+        qs = np.asarray(qs, dtype=float).reshape((-1, 2))
+        (ny, nx, _) = self.grid.shape
+        (x, y) = (qs[:, 0] / self.step, qs[:, 1] / self.step)
+        inside = (x >= 0) & (x <= nx - 1) & (y >= 0) & (y <= ny - 1)
+
+        # Cell indices and fractional positions inside the cells.
+        i = np.clip(np.floor(y), 0, ny - 2).astype(np.intp)
+        j = np.clip(np.floor(x), 0, nx - 2).astype(np.intp)
+        (fy, fx) = ((y - i)[:, None], (x - j)[:, None])
+
+        # Bilinear interpolation of (wx, wy).
+        ws = (
+            (1 - fx) * (1 - fy) * self.grid[i, j]
+            + fx * (1 - fy) * self.grid[i, j + 1]
+            + (1 - fx) * fy * self.grid[i + 1, j]
+            + fx * fy * self.grid[i + 1, j + 1]
+        )
+        inside &= ~np.isnan(ws).any(axis=1)
+        rs = np.concatenate([ws, np.ones((ws.shape[0], 1))], axis=1)
+        return (rs, inside)
+
+
+##-----------------------------------------------------------------------------
+# Build a lookup table of view rays for a camera and a frame resolution.
+
+# The grid covers all pixels of the frame. The error bound is measured
+# at the cell centers, where the bilinear interpolation error peaks:
+# it is the maximal distance between a cell center and the projection of
+# its interpolated view ray. The error grows as O(step^2) with the
+# curvature of the inverse distortion; it is zero for a pure pinhole.
+# Nodes where the solver does not converge are stored as NaN, their
+# cells are left to the exact solver and out of the error bound.
+
+# cam: dict of camera parameters
+# width, height: frame resolution, pixels
+# step: grid spacing, pixels
+# return: RayLUT
+
+
+def build_ray_lut(cam, width, height, step):
+
+    # Extract the intrinsic parameters.
+    imtx = np.array(cam["intrinsics"]["camera_matrix"])
+    dist = np.array(cam["intrinsics"]["distortion_coefficients"])
+    dist = dist.reshape((1, -1))
+
+    # Grid nodes, covering [0, width - 1] x [0, height - 1].
+    nx = max(int(np.ceil((width - 1) / step)) + 1, 2)
+    ny = max(int(np.ceil((height - 1) / step)) + 1, 2)
+    (uu, vv) = np.meshgrid(np.arange(nx) * step, np.arange(ny) * step)
+    qs = np.stack([uu.ravel(), vv.ravel()], axis=1).astype(float)
+
+    # Solve all nodes in one batch.
+    (rs, conv) = cv_view_rays(qs, imtx, dist)
+    rs[~conv] = np.nan
+    grid = rs[:, :2].reshape((ny, nx, 2))
+    lut = RayLUT(grid, step, 0.0)
+
+    # Measure the interpolation error at the cell centers.
+    qc = qs.reshape((ny, nx, 2))[:-1, :-1].reshape((-1, 2)) + 0.5 * step
+    (rc, valid) = lut.view_rays(qc)
+    ipar = to_ipar(imtx, dist)
+    err = np.linalg.norm(cvcore_batch(rc[valid], ipar) - qc[valid], axis=1)
+    lut.error = float(err.max()) if err.size else 0.0
+
+    return lut
+
+
+##-----------------------------------------------------------------------------
+# Store a lookup table as a .npy grid with a .json sidecar.
+
+# lut: RayLUT
+# path: file name of the grid, *.npy
+
+
+def save_ray_lut(lut, path):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, np.ascontiguousarray(lut.grid))
+    with open(path + ".json.tmp", "w") as f:
+        json.dump({"step": lut.step, "error": lut.error}, f)
+    os.replace(path + ".json.tmp", path + ".json")
+    os.replace(tmp, path)
+
+
+##-----------------------------------------------------------------------------
+# Load a lookup table, memory-mapping the grid.
+
+# path: file name of the grid, *.npy
+# return: RayLUT
+
+
+def load_ray_lut(path):
+    with open(path + ".json", "r") as f:
+        meta = json.load(f)
+    grid = np.load(path, mmap_mode="r")
+    return RayLUT(grid, meta["step"], meta["error"])
+
+
+##-----------------------------------------------------------------------------
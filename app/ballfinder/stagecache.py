@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+##
+## Description: Bounded cache of intermediate detection results.
+#############################################################################
+
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class StageCache(object):
+
+    ##---------------------------------------------------------------------------
+    # Initialize the cache.
+
+    # Entries are evicted in least-recently-used order once their total
+    # size exceeds max_bytes. Cached values are shared: callers must not
+    # modify them.
+
+    # max_bytes: int, size limit of the cached values, bytes
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__resources = {}
+        self.__lock = threading.RLock()
+
+    ##---------------------------------------------------------------------------
+    # Key of an input frame.
+
+    # img: array
+    # return: string
+
+    def frame_key(self, img):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{img.shape}{img.dtype}".encode())
+        h.update(np.ascontiguousarray(img).data)
+        return h.hexdigest()
+
+    ##---------------------------------------------------------------------------
+    # Key of a stage output.
+
+    # name: stage name
+    # deps: list of keys of the stage inputs
+    # params: dict of the config values read by the stage
+    # return: string
+
+    def stage_key(self, name, deps, params):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(name.encode())
+        for dep in deps:
+            h.update(dep.encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()
+
+    ##---------------------------------------------------------------------------
+    # Look up a stage output, computing and storing it on a miss.
+
+    # key: string, see stage_key()
+    # compute: function without arguments, returning the stage output
+    # return: stage output
+
+    def get(self, key, compute):
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return self.__entries[key][0]
+        value = compute()
+        size = value_nbytes(value)
+        with self.__lock:
+            self.misses += 1
+            if key in self.__entries or size > self.max_bytes:
+                return value
+            self.__entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                (_, (_, old)) = self.__entries.popitem(last=False)
+                self.nbytes -= old
+        return value
+
+    ##---------------------------------------------------------------------------
+    # Look up a long-lived resource, e.g. a model, loading it once.
+
+    # Resources are not counted against max_bytes and never evicted.
+
+    # key: hashable
+    # load: function without arguments, returning the resource
+    # return: resource
+
+    def resource(self, key, load):
+        with self.__lock:
+            if key not in self.__resources:
+                self.__resources[key] = load()
+            return self.__resources[key]
+
+    ##---------------------------------------------------------------------------
+    # Drop all stage outputs.
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.nbytes = 0
+
+
+##-----------------------------------------------------------------------------
+# Estimate the memory size of a stage output.
+
+# value: array, or nested lists and tuples of arrays and scalars
+# return: int, bytes
+
+
+def value_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(value_nbytes(v) for v in value)
+    return 32
+
+
+##-----------------------------------------------------------------------------
@@ -34,6 +34,8 @@ DEFAULT_CONF = {
         "model": "yolo11n-seg.pt",
         "classId": 32,
         "minConfidence": 0.1,
+        "maskContours": False,
+        "imgsz": 640,
     },
     "GaussianBlur": {"ksize": 5, "sigmaX": 0},
     "Canny": {"threshold1": 125, "threshold2": 96},
@@ -47,7 +49,33 @@ DEFAULT_CONF = {
         "maxRadius": 200,
     },
     "FindContours": {"points": 30, "minRelScale": 0.75, "maxRelScale": 1.25},
-    "ShowTargets": {"points": 20},
+    "Fitting": "REFINE",
+    "ShowTargets": {"points": 20, "mode": "OUTLINE"},
+    "RayLUT": {"enabled": True, "step": 8, "maxError": 0.001},
+    "Instrument": {"enabled": False, "window": 100},
+    "Video": {
+        "processes": 1,
+        "chunkFrames": 50,
+        "threads": 1,
+        "queueSize": 8,
+        "checkpointFrames": 100,
+    },
+    "Cache": {"maxMB": 2048},
+    "Camera": {
+        "fps": 20,
+        "workers": 1,
+        "rateControl": False,
+        "frameBudgetMs": 100,
+        "showTelemetry": False,
+        "telemetryWindow": 120,
+    },
+    "Engine": {
+        "enabled": False,
+        "processes": 1,
+        "slots": 4,
+        "slotMB": 32,
+        "timeoutS": 60,
+    },
 }
 
 logger = logging.getLogger(__name__)
@@ -61,6 +89,16 @@ class Config(object):
         except FileNotFoundError:
             logger.error("Config file not found")
             self.__conf = copy.deepcopy(DEFAULT_CONF)
+        self.__add_defaults()
+
+    def __add_defaults(self):
+        # Config files saved by older versions lack newer sections and keys.
+        for section, values in DEFAULT_CONF.items():
+            if section not in self.__conf:
+                self.__conf[section] = copy.deepcopy(values)
+            elif isinstance(values, dict):
+                for key, value in values.items():
+                    self.__conf[section].setdefault(key, copy.deepcopy(value))
 
     def reset(self):
         logger.info("Resetting config")
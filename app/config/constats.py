@@ -27,6 +27,7 @@ from enum import Enum
 
 ROOT_PATH = os.path.abspath(os.curdir)
 CONFIG_PATH = os.path.join(ROOT_PATH, "config.json")
+CACHE_PATH = os.path.join(ROOT_PATH, "cache")
 
 FILE_NOT_SELECTED = "The file is not selected"
 CAMERA_NOT_SELECTED = "The camera is not selected"
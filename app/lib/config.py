@@ -22,10 +22,14 @@
 ## Contact: call-a-ball@high-stake.de
 #############################################################################
 
+import hashlib
 import json
 import logging
 
 import h5py
+import numpy as np
+
+from app.ballfinder.raylut import build_ray_lut, load_ray_lut, save_ray_lut
 
 logger = logging.getLogger(__name__)
 
@@ -99,3 +103,37 @@ def is_hdf5(file_path):
             return True
     except (OSError, IOError):
         return False
+
+
+def attach_ray_lut(camera: dict, config_path: str, height: int, width: int, cfg):
+    lut_cfg = cfg["RayLUT"]
+    if not lut_cfg["enabled"]:
+        return camera
+
+    step = lut_cfg["step"]
+    # The values may be numpy scalars, e.g. from a float32 HDF5 config.
+    intrinsics = camera["intrinsics"]
+    digest = hashlib.sha1()
+    for name in ("camera_matrix", "distortion_coefficients"):
+        digest.update(np.asarray(intrinsics[name], dtype=np.float64).tobytes())
+    digest = digest.hexdigest()[:12]
+    lut_path = f"{config_path}.raylut_{width}x{height}_s{step}_{digest}.npy"
+
+    try:
+        lut = load_ray_lut(lut_path)
+        logger.info(f"ray LUT loaded: {lut_path}")
+    except (OSError, ValueError, KeyError):
+        logger.info(f"build ray LUT: {width}x{height}, step {step}")
+        lut = build_ray_lut(camera, width, height, step)
+        try:
+            save_ray_lut(lut, lut_path)
+        except OSError as err:
+            logger.warning(f"ray LUT not saved: {err}")
+    logger.info(f"ray LUT error bound: {lut.error:.2e} px")
+    if not lut.error <= lut_cfg["maxError"]:
+        # The exact solver is used instead.
+        logger.warning(f"ray LUT not used, error bound {lut.error:.2e} px")
+        return camera
+
+    camera["ray_lut"] = lut
+    return camera
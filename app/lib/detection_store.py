@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from app.ballfinder.dettable import DetectionTable, build_table
+from app.lib.results_cache import results_key
+
+logger = logging.getLogger(__name__)
+
+# Each line starts with the frame number, written and parsed explicitly,
+# so that the index is built without decoding the lines.
+FRAME_PREFIX = b'{"i":'
+
+
+def video_store_path(video_path: str, cfg: dict, camera: dict, diameter: float):
+    # Content-addressed, see results_key(): the same video file with the
+    # same settings, calibration and diameter maps to the same store.
+    return results_key("video", video_path, cfg, camera, diameter)
+
+
+class DetectionStore:
+    # Append-only store of per-frame detections: one JSON line per frame
+    # in <path>.jsonl, in frame order, and a checkpoint <path>.ckpt.json
+    # with the last completed frame and the file size up to it. Lines
+    # after the checkpoint are dropped on resume.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data_path = path + ".jsonl"
+        self.ckpt_path = path + ".ckpt.json"
+        self.last_frame = 0
+        self.done = False
+        self._writer = None
+        self._reader = None
+        self._index = None
+        self._lock = threading.Lock()
+        self._read_checkpoint()
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.ckpt_path, "r") as f:
+                ckpt = json.load(f)
+            self.last_frame = ckpt["frame"]
+            self.done = ckpt["done"]
+            self._offset = ckpt["offset"]
+        except (OSError, ValueError, KeyError):
+            self.last_frame = 0
+            self.done = False
+            self._offset = 0
+
+    def resume(self) -> int:
+        # Open for appending after the last checkpoint; returns the number
+        # of the next frame to process.
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        mode = "r+b" if os.path.exists(self.data_path) else "wb"
+        self._writer = open(self.data_path, mode)
+        self._writer.truncate(self._offset)
+        self._writer.seek(self._offset)
+        self._index = None
+        if self.last_frame:
+            logger.info(f"Resume {self.data_path} after frame {self.last_frame}")
+        return self.last_frame + 1
+
+    def append(self, i: int, cands, conts, balls, err: str):
+        item = json.dumps(
+            {
+                "err": err,
+                "cands": [np.asarray(cand, dtype=float).tolist() for cand in cands],
+                "conts": [np.asarray(cont, dtype=float).tolist() for cont in conts],
+                "balls": [np.asarray(ball, dtype=float).tolist() for ball in balls],
+            },
+            separators=(",", ":"),
+        )
+        line = FRAME_PREFIX + b"%d," % i + item[1:].encode()
+        self._writer.write(line + b"\n")
+        self.last_frame = i
+
+    def checkpoint(self, done: bool = False):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._offset = self._writer.tell()
+        self.done = done
+        ckpt = {"frame": self.last_frame, "offset": self._offset, "done": done}
+        tmp = self.ckpt_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(ckpt, f)
+        os.replace(tmp, self.ckpt_path)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _build_index(self):
+        # Byte offset of each frame's line, from the "i" field alone.
+        index = {}
+        if not os.path.exists(self.data_path):
+            return index
+        with open(self.data_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if offset + len(line) > self._offset:
+                    break
+                if not line.startswith(FRAME_PREFIX):
+                    raise ValueError(f"Bad line in {self.data_path} at {offset}")
+                index[int(line[len(FRAME_PREFIX) : line.index(b",")])] = offset
+                offset += len(line)
+        return index
+
+    def frames(self) -> list:
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+            return sorted(self._index)
+
+    def read(self, i: int):
+        # Returns (cands, conts, balls, err) of a frame, None if not stored.
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+            if i not in self._index:
+                return None
+            if self._reader is None:
+                self._reader = open(self.data_path, "rb")
+            self._reader.seek(self._index[i])
+            item = json.loads(self._reader.readline())
+        cands = [np.array(cand) for cand in item["cands"]]
+        conts = [[np.array(q) for q in cont] for cont in item["conts"]]
+        balls = [np.array(ball) for ball in item["balls"]]
+        return cands, conts, balls, item["err"]
+
+    def candidates(self) -> dict:
+        # 2D results of all frames without errors, see VideoDetector.
+        res = {}
+        for i in self.frames():
+            (cands, conts, _, err) = self.read(i)
+            if not err:
+                res[i] = (cands, conts)
+        return res
+
+    def located(self) -> list:
+        # (frame number, cands, balls) of all frames without errors.
+        res = []
+        for i in self.frames():
+            (cands, _, balls, err) = self.read(i)
+            if not err:
+                res.append((i, cands, balls))
+        return res
+
+
+def load_table(store: DetectionStore, radius, camera, cfg) -> DetectionTable:
+    # Columnar table of a finished store, saved next to it and memory
+    # mapped, so that reopening a processed video reads only what is shown.
+    try:
+        return DetectionTable.load(store.path, camera, cfg)
+    except (OSError, ValueError):
+        pass
+    table = build_table(store.located(), radius, camera, cfg)
+    try:
+        table.save(store.path)
+        return DetectionTable.load(store.path, camera, cfg)
+    except (OSError, ValueError) as err:
+        logger.warning(f"Detection table not saved: {err}")
+        return table
@@ -173,6 +173,40 @@ def draw_text(image, detection, base_point=None):
     return image
 
 
+def draw_telemetry(image, lines):
+    logger.debug(f"draw_telemetry")
+    thickness = max(get_thickness(image) // 2, 1)
+    font_scale = get_font_scale(image) * 0.6
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    color = (255, 255, 255)
+
+    for j, line in enumerate(lines):
+        (_, text_height), _ = cv2.getTextSize(line, font, font_scale, thickness)
+        text_x = 10
+        text_y = 10 + (j + 1) * int(text_height * 1.8)
+        cv2.putText(
+            image,
+            line,
+            (text_x, text_y),
+            font,
+            font_scale,
+            (0, 0, 0),
+            thickness + 3,
+            cv2.LINE_AA,
+        )
+        cv2.putText(
+            image,
+            line,
+            (text_x, text_y),
+            font,
+            font_scale,
+            color,
+            thickness,
+            cv2.LINE_AA,
+        )
+    return image
+
+
 def valid_coordinates(x: int, y: int, image) -> bool:
     height, width, _ = image.shape
     logger.debug(f"valid_coordinates size: {width}, {height} center: {x}, {y}")
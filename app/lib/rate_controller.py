@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import copy
+from collections import deque
+
+import numpy as np
+
+from app.ballfinder.ballfinder import scaled_config
+
+# Quality levels, best first. scale: image resize factor; imgsz, points:
+# factors of the configured YOLO input size and number of contour points.
+# Each level makes a frame's detection cheaper; skipping frames would not
+# (the controller measures per frame), and the detection workers take the
+# latest frame anyway, which skips frames whenever they fall behind.
+LEVELS = [
+    {"scale": 1.0, "imgsz": 1.0, "points": 1.0},
+    {"scale": 1.0, "imgsz": 1.0, "points": 0.67},
+    {"scale": 1.0, "imgsz": 0.75, "points": 0.67},
+    {"scale": 0.75, "imgsz": 0.75, "points": 0.67},
+    {"scale": 0.5, "imgsz": 0.5, "points": 0.5},
+]
+
+# Fewest contour points the controller goes down to.
+MIN_POINTS = 8
+
+
+class RateController:
+    # Feedback control of the detection quality: one level down when the
+    # median detection time of the last `window` frames exceeds the
+    # budget, one level up when it is below `headroom` times the budget.
+    # The window restarts after each change, to see its effect first.
+
+    def __init__(self, budget: float, window: int = 10, headroom: float = 0.6):
+        self.budget = budget
+        self.headroom = headroom
+        self.level = 0
+        self._times = deque(maxlen=window)
+
+    def update(self, seconds: float) -> bool:
+        # Detection time of a frame; True if the level has changed.
+        self._times.append(seconds)
+        if len(self._times) < self._times.maxlen:
+            return False
+        median = float(np.median(self._times))
+        if median > self.budget and self.level < len(LEVELS) - 1:
+            self.level += 1
+        elif median < self.headroom * self.budget and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self._times.clear()
+        return True
+
+    def settings(self, cfg: dict) -> dict:
+        # Settings of the current level, in absolute values.
+        level = LEVELS[self.level]
+        imgsz = cfg["YOLO"]["imgsz"] * level["imgsz"]
+        points = cfg["FindContours"]["points"]
+        min_points = min(MIN_POINTS, points)
+        return {
+            "level": self.level,
+            "scale": level["scale"],
+            "imgsz": max(int(round(imgsz / 32)), 1) * 32,
+            "points": max(int(round(points * level["points"])), min_points),
+        }
+
+    def config(self, cfg: dict) -> dict:
+        # Detection config of the current level, for BallFinder.
+        settings = self.settings(cfg)
+        cfg = scaled_config(copy.deepcopy(cfg), settings["scale"])
+        cfg["YOLO"]["imgsz"] = settings["imgsz"]
+        cfg["FindContours"]["points"] = settings["points"]
+        return cfg
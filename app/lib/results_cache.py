@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from app.config.constats import CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Config sections which affect the detections and their geometry; the
+# others (timing, threads, display, cache) do not invalidate results.
+DETECTION_SECTIONS = (
+    "Detector",
+    "YOLO",
+    "GaussianBlur",
+    "Canny",
+    "Dilate",
+    "HoughCircles",
+    "FindContours",
+    "Fitting",
+)
+
+# Sampled blocks of a media file, see media_digest().
+SAMPLE_BLOCKS = 16
+SAMPLE_SIZE = 64 * 1024
+
+
+def media_digest(media) -> str:
+    # Fast content hash: the file size and evenly spaced blocks, so that
+    # a renamed or copied file hits, and large videos are not read whole.
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(media, np.ndarray):
+        h.update(f"{media.shape}{media.dtype}".encode())
+        h.update(np.ascontiguousarray(media).data)
+        return h.hexdigest()
+    size = os.path.getsize(media)
+    h.update(str(size).encode())
+    with open(media, "rb") as f:
+        step = max(size // SAMPLE_BLOCKS, SAMPLE_SIZE)
+        for offset in range(0, size, step):
+            f.seek(offset)
+            h.update(f.read(SAMPLE_SIZE))
+        f.seek(max(size - SAMPLE_SIZE, 0))
+        h.update(f.read(SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+def detection_settings(cfg: dict) -> dict:
+    return {name: cfg[name] for name in DETECTION_SECTIONS}
+
+
+def results_key(kind: str, media, cfg: dict, camera: dict, diameter: float) -> str:
+    # Media content, canonical detection settings, calibration and diameter.
+    intrinsics = [
+        np.asarray(camera["intrinsics"][name], dtype=float).tolist()
+        for name in ("camera_matrix", "distortion_coefficients")
+    ]
+    key = json.dumps(
+        [kind, media_digest(media), detection_settings(cfg), intrinsics, diameter],
+        sort_keys=True,
+    )
+    digest = hashlib.blake2b(key.encode(), digest_size=20).hexdigest()
+    return os.path.join(CACHE_PATH, f"{kind}_{digest}")
+
+
+def touch(path: str):
+    # Mark a cache entry (all files <path>.*) as recently used.
+    for name in glob.glob(glob.escape(path) + ".*"):
+        try:
+            os.utime(name)
+        except OSError:
+            pass
+
+
+def evict(max_bytes: int, keep: str = None):
+    # Remove the least recently used entries until the cache fits.
+    entries = {}
+    try:
+        names = os.listdir(CACHE_PATH)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(CACHE_PATH, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = os.path.join(CACHE_PATH, name.split(".", 1)[0])
+        (size, mtime, files) = entries.get(entry, (0, 0, []))
+        files.append(path)
+        entries[entry] = (size + stat.st_size, max(mtime, stat.st_mtime), files)
+
+    total = sum(size for (size, _, _) in entries.values())
+    for entry, (size, _, files) in sorted(entries.items(), key=lambda e: e[1][1]):
+        if total <= max_bytes:
+            break
+        if entry == keep:
+            continue
+        logger.info(f"Evict {entry} from the results cache")
+        for path in files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def load_photo_results(path: str):
+    # Returns (cands, conts, balls) of a cached photo, None on a miss.
+    try:
+        with open(path + ".json", "r") as f:
+            item = json.load(f)
+    except (OSError, ValueError):
+        return None
+    touch(path)
+    cands = [np.array(cand) for cand in item["cands"]]
+    conts = [[np.array(q) for q in cont] for cont in item["conts"]]
+    balls = [np.array(ball) for ball in item["balls"]]
+    return cands, conts, balls
+
+
+def save_photo_results(path: str, cands, conts, balls):
+    item = {
+        "cands": [np.asarray(cand, dtype=float).tolist() for cand in cands],
+        "conts": [np.asarray(cont, dtype=float).tolist() for cont in conts],
+        "balls": [np.asarray(ball, dtype=float).tolist() for ball in balls],
+    }
+    try:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(item, f)
+        os.replace(tmp, path + ".json")
+    except OSError as err:
+        logger.warning(f"Photo results not cached: {err}")
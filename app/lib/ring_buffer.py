@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import threading
+
+
+class RingBuffer:
+    # Bounded FIFO over preallocated slots where the newest item wins: a
+    # put into a full buffer overwrites the oldest item instead of
+    # blocking or growing. Readers sleep on a condition variable until
+    # an item arrives or the buffer is closed.
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.puts = 0
+        self.dropped = 0
+        self.closed = False
+        self._slots = [None] * capacity
+        self._head = 0
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, item):
+        with self._cond:
+            tail = (self._head + self._size) % self.capacity
+            self._slots[tail] = item
+            if self._size == self.capacity:
+                # Overwrote the oldest item.
+                self._head = (self._head + 1) % self.capacity
+                self.dropped += 1
+            else:
+                self._size += 1
+            self.puts += 1
+            self._cond.notify()
+
+    def get(self, timeout: float = None):
+        # Oldest item; None on a timeout or once closed and empty.
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._size or self.closed, timeout):
+                return None
+            if not self._size:
+                return None
+            item = self._slots[self._head]
+            self._slots[self._head] = None
+            self._head = (self._head + 1) % self.capacity
+            self._size -= 1
+            return item
+
+    def latest(self, timeout: float = None):
+        # Newest item; the older ones are skipped and counted as dropped.
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._size or self.closed, timeout):
+                return None
+            if not self._size:
+                return None
+            tail = (self._head + self._size - 1) % self.capacity
+            item = self._slots[tail]
+            self.dropped += self._size - 1
+            for k in range(self.capacity):
+                self._slots[k] = None
+            self._head = 0
+            self._size = 0
+            return item
+
+    def close(self):
+        # Wakes up all readers; items already in the buffer can be read.
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Stages of the live camera mode, in order.
+STAGES = ("capture", "detect", "display")
+
+
+class Telemetry:
+    # Rolling frame rates of the stages and latencies since capture, over
+    # the last `window` frames of each stage. Timestamps are taken with
+    # time.perf_counter(); the stages may run in different threads.
+
+    def __init__(self, window: int = 120):
+        self.window = window
+        self._ticks = {stage: deque(maxlen=window) for stage in STAGES}
+        self._latencies = {stage: deque(maxlen=window) for stage in STAGES[1:]}
+        self._lock = threading.Lock()
+
+    def tick(self, stage: str, captured: float = None) -> float:
+        # A frame passed a stage; captured is its capture timestamp.
+        now = time.perf_counter()
+        with self._lock:
+            self._ticks[stage].append(now)
+            if captured is not None:
+                self._latencies[stage].append(now - captured)
+        return now
+
+    def fps(self, stage: str) -> float:
+        with self._lock:
+            ticks = list(self._ticks[stage])
+        if len(ticks) < 2 or ticks[-1] == ticks[0]:
+            return 0.0
+        return (len(ticks) - 1) / (ticks[-1] - ticks[0])
+
+    def latency(self, stage: str, qs=(50, 95, 100)) -> list:
+        # Percentiles of the latency since capture, ms.
+        with self._lock:
+            values = list(self._latencies[stage])
+        if not values:
+            return [0.0 for _ in qs]
+        return [1000 * v for v in np.percentile(np.array(values), qs)]
+
+    def snapshot(self) -> dict:
+        # {"fps": {stage: fps}, "latency": {stage: {"p50", "p95", "max"}}}
+        latency = {}
+        for stage in self._latencies:
+            (p50, p95, pmax) = self.latency(stage)
+            latency[stage] = {"p50": p50, "p95": p95, "max": pmax}
+        return {
+            "fps": {stage: self.fps(stage) for stage in STAGES},
+            "latency": latency,
+        }
+
+
+def telemetry_lines(snapshot: dict) -> list[str]:
+    # Text of the on-screen overlay.
+    fps = snapshot["fps"]
+    lines = [" / ".join(f"{stage} {fps[stage]:.1f}" for stage in STAGES) + " fps"]
+    for stage, ms in snapshot["latency"].items():
+        lines.append(
+            f"{stage}: {ms['p50']:.0f} ms (p95 {ms['p95']:.0f}, max {ms['max']:.0f})"
+        )
+    if "dropped" in snapshot:
+        (captured, detected) = snapshot["dropped"]
+        lines.append(f"dropped: {captured} captured, {detected} detected")
+    if "rate" in snapshot:
+        rate = snapshot["rate"]
+        lines.append(
+            f"level {rate['level']}: scale {rate['scale']},"
+            f" imgsz {rate['imgsz']}, points {rate['points']}"
+        )
+    return lines
@@ -31,11 +31,19 @@ from PyQt6.QtWidgets import QLabel, QPushButton
 from app.windows.camera_selector import CameraSelector
 from app.components.input_number import InputNumber
 from app.components.video_widget import VideoWidget
+from app.config.config import config
 from app.config.constats import CAMERA_NOT_SELECTED
 from app.modules.detectors.camera_detector import CameraDetector
 from app.lib.calc import is_point_in_circle
-from app.lib.drawing import draw_contour, draw_center, draw_text, draw_lines
+from app.lib.drawing import (
+    draw_contour,
+    draw_center,
+    draw_text,
+    draw_lines,
+    draw_telemetry,
+)
 from app.lib.formaters import elide_text, np_to_pixmap
+from app.lib.telemetry import telemetry_lines
 from app.lib.ui import handle_error
 
 logger = logging.getLogger(__name__)
@@ -50,6 +58,8 @@ class CameraModule:
         self.current_frame = None
         self.selected_ball = None
         self.balls = []
+        self.telemetry = None
+        self.show_telemetry = False
         self.camera_index = None
         self.thread_camera = None
         self._main_window = main_window
@@ -125,6 +135,7 @@ class CameraModule:
             self.thread_camera.requestInterruption()
             self.thread_camera.wait()
         self.thread_camera = None
+        self.telemetry = None
         self.camera_resolution_enabled(True)
 
     def start_thread(self):
@@ -133,8 +144,11 @@ class CameraModule:
             self.camera_resolution_enabled(False)
             self.btn_apply_coords_set_enabled(False)
 
+            self.show_telemetry = config.values["Camera"]["showTelemetry"]
             self.thread_camera = CameraDetector()
             self.thread_camera.frame_ready.connect(self.update_video)
+            self.thread_camera.telemetry_ready.connect(self.update_telemetry)
+            self.thread_camera.rate_adjusted.connect(self.rate_adjusted)
             self.thread_camera.camera_resolution.connect(self.set_camera_resolution)
             self.thread_camera.error_signal.connect(handle_error)
             height = self.input_camera_height.value()
@@ -148,10 +162,21 @@ class CameraModule:
         logger.debug("camera stop")
         self.stop_thread()
 
-    def update_video(self, image: np.array, data: list):
+    def update_video(self, image: np.array, data: list, captured: float):
         self.balls = data
         self.current_frame = image
         self.__draw()
+        if self.thread_camera:
+            self.thread_camera.displayed(captured)
+
+    def update_telemetry(self, snapshot: dict):
+        logger.debug(f"Camera telemetry: {snapshot}")
+        self.telemetry = snapshot
+
+    def rate_adjusted(self, settings: dict):
+        logger.info(f"Camera detection settings adjusted: {settings}")
+        if self.telemetry is not None:
+            self.telemetry["rate"] = settings
 
     def toggle_camera(self):
         logger.info("toggle camera")
@@ -168,7 +193,14 @@ class CameraModule:
             and self.config_path
             and self.camera_index is not None
         ):
-            self.camera_processing()
+            if (
+                self.thread_camera
+                and self.thread_camera.camera_index == self.camera_index
+            ):
+                # Only the geometry changed: keep the camera running.
+                self.thread_camera.set_geometry(self.diameter, self.config_path)
+            else:
+                self.camera_processing()
         else:
             self.stop()
 
@@ -214,5 +246,7 @@ class CameraModule:
         if self.base_point:
             draw_center(frame, [self.base_point], color=(0, 255, 0))
             draw_lines(frame, self.base_point, self.balls)
+        if self.telemetry and self.thread_camera and self.show_telemetry:
+            draw_telemetry(frame, telemetry_lines(self.telemetry))
         pixmap = np_to_pixmap(frame)
         self.display_camera.setPixmap(pixmap)
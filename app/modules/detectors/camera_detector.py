@@ -23,31 +23,40 @@
 #############################################################################
 
 import logging
-from queue import Queue
+import threading
+import time
 
 import cv2
 import numpy as np
-from PyQt6.QtCore import QThread, pyqtSignal, QRunnable, QThreadPool
+from PyQt6.QtCore import QThread, pyqtSignal
 
-from app.ballfinder.ballfinder import BallFinder
+from app.ballfinder.cammodel import CameraModel
+from app.ballfinder.instrument import Instrument
+from app.ballfinder.detection import project_detections
 from app.config.config import config
-from app.lib.config import read_camera_config
+from app.lib.config import attach_ray_lut, read_camera_config
+from app.lib.rate_controller import RateController
+from app.lib.ring_buffer import RingBuffer
+from app.lib.telemetry import Telemetry
+from app.modules.detectors.engine import create_ball_finder
 
 logger = logging.getLogger(__name__)
 
+# Slots of the captured and of the detected frames.
+BUFFER_FRAMES = 2
 
-class Worker(QRunnable):
-    def __init__(self, function, *args):
-        super().__init__()
-        self.function = function
-        self.args = args
+# Seconds between telemetry_ready signals.
+TELEMETRY_INTERVAL = 1.0
 
-    def run(self):
-        self.function(*self.args)
+# Seconds a detected frame may wait for an earlier one still in detection.
+REORDER_WAIT = 0.1
 
 
 class CameraDetector(QThread):
-    frame_ready = pyqtSignal((np.ndarray, list))
+    # frame, detections, capture timestamp (time.perf_counter())
+    frame_ready = pyqtSignal((np.ndarray, list, float))
+    telemetry_ready = pyqtSignal(dict)
+    rate_adjusted = pyqtSignal(dict)
     camera_resolution = pyqtSignal((int, int))
     error_signal = pyqtSignal(str)
 
@@ -56,12 +65,31 @@ class CameraDetector(QThread):
         self._config_path = None
         self._camera_index = None
         self._diameter = None
+        self._frame_size = None
+
+        cfg = config.values
+        self.fps = cfg["Camera"]["fps"]
+        self.workers = cfg["Camera"]["workers"]
+        # Capture, detection and display run at their own rates; a slower
+        # stage only sees the latest frames of the one before it.
+        self.frames = RingBuffer(BUFFER_FRAMES)
+        self.results = RingBuffer(max(BUFFER_FRAMES, self.workers))
+        self.telemetry = Telemetry(cfg["Camera"]["telemetryWindow"])
+        # Settings of the rate controller, None without one.
+        self.rate_settings = None
+        self._late = 0
 
-        self.fps = 20
-        self.show_video = False
-        self.delay_buffer = Queue()
-        self.ready_frames = Queue()
-        self.detection = None
+        # Shared by the detection workers, guarded by _lock.
+        self._lock = threading.Lock()
+        self._camera = None
+        # Geometry changes, counted; the one the camera model is built for.
+        self._geometry = 0
+        self._camera_geometry = 0
+        self._geometry_changed = False
+        self._rate = None
+        self._rate_cfg = None
+        self._in_detection = set()
+        self._running = 0
 
         self.width = 10000
         self.height = 10000
@@ -73,6 +101,20 @@ class CameraDetector(QThread):
         self.width = width
         self.height = height
 
+    @property
+    def camera_index(self):
+        return self._camera_index
+
+    def set_geometry(self, diameter, config_path):
+        # Picked up by the running detection, without restarting the camera.
+        if (diameter, config_path) == (self._diameter, self._config_path):
+            return
+        with self._lock:
+            self._diameter = diameter
+            self._config_path = config_path
+            self._geometry += 1
+            self._geometry_changed = True
+
     def init_camera(self):
         logger.info("init_camera")
         capture = cv2.VideoCapture(self._camera_index)
@@ -86,59 +128,183 @@ class CameraDetector(QThread):
 
     def read_config(self, width: int, height: int):
         camera = read_camera_config(self._config_path, height, width)
-        return camera, config.values
-
-    def detect(self, camera, cfg):
-        count = 0
-        ball_finder = BallFinder(cfg)
-        while not self.isInterruptionRequested():
-            if self.delay_buffer.empty():
-                continue
-            self.update_frame()
-            frame = self.delay_buffer.get()
-            (res, err) = ball_finder.find_balls(frame, self._diameter / 2, camera)
-
-            if err:
-                logger.debug(f"findTargets error: {err}")
-                logger.info(f"skip frame")
-            else:
-                self.detection = res
-
-            if count > 4:
-                self.show_video = True
-            else:
-                count += 1
-            self.ready_frames.put((frame, self.detection))
-        self.show_video = False
-
-    def update_frame(self):
-        if self.detection is None:
-            return
-        frame_count = self.delay_buffer.qsize()
-        for i in range(frame_count):
-            frame = self.delay_buffer.get()
-            self.ready_frames.put((frame, self.detection))
+        cfg = config.values
+        camera = CameraModel(
+            attach_ray_lut(camera, self._config_path, height, width, cfg)
+        )
+        return camera, cfg
+
+    @property
+    def dropped_frames(self) -> (int, int):
+        # Captured frames never detected, detected frames never shown.
+        return self.frames.dropped, self.results.dropped + self._late
+
+    def detect(self, cfg):
+        # One detection worker; there are Camera.workers of them, each
+        # with its own BallFinder, taking the latest captured frames.
+        instr = None
+        if cfg["Instrument"]["enabled"]:
+            instr = Instrument(cfg["Instrument"]["window"])
+        ball_finder = create_ball_finder(
+            cfg, instr, cancelled=self.isInterruptionRequested
+        )
+        try:
+            while not self.isInterruptionRequested():
+                item = self.frames.latest(timeout=0.1)
+                if item is None:
+                    if self.frames.closed:
+                        break
+                    continue
+                (seq, captured, frame) = item
+                with self._lock:
+                    settings = self.rate_settings or {"scale": 1.0}
+                    self._in_detection.add(seq)
+                    rebuild = self._geometry if self._geometry_changed else None
+                    self._geometry_changed = False
+                    camera = self._camera
+                    if self._rate_cfg is not None:
+                        ball_finder.cfg = self._rate_cfg
+                try:
+                    if rebuild is not None:
+                        # Outside the lock: building a ray LUT takes seconds,
+                        # the other workers go on with the old model.
+                        camera = self.update_camera(camera)
+                        with self._lock:
+                            # Unless a later change was built meanwhile.
+                            if rebuild > self._camera_geometry:
+                                self._camera = camera
+                                self._camera_geometry = rebuild
+                    started = time.perf_counter()
+                    (res, err) = ball_finder.find_balls(
+                        frame, self._diameter / 2, camera, settings["scale"]
+                    )
+                    self.adjust_rate(time.perf_counter() - started, cfg)
+
+                    if err:
+                        logger.debug(f"findTargets error: {err}")
+                        logger.info(f"skip frame")
+                        res = []
+                    else:
+                        # Every frame is shown: re-project here, not in the GUI.
+                        with ball_finder.instr.stage("project"):
+                            project_detections(res)
+                    if instr is not None and instr.frames % instr.window == 0:
+                        logger.info(f"Detection stages: {instr.summary()}")
+                        logger.info(f"Dropped frames: {self.dropped_frames}")
+                    self.telemetry.tick("detect", captured)
+                finally:
+                    # Queued and marked done at once, see display_frames().
+                    with self._lock:
+                        self.results.put((seq, captured, frame, res))
+                        self._in_detection.discard(seq)
+        finally:
+            with self._lock:
+                self._running -= 1
+                if self._running == 0:
+                    self.results.close()
+
+    def adjust_rate(self, seconds: float, cfg):
+        # Feeds the detection time of a frame to the rate controller.
+        with self._lock:
+            if self._rate is None or not self._rate.update(seconds):
+                return
+            settings = self.rate_settings = self._rate.settings(cfg)
+            self._rate_cfg = self._rate.config(cfg)
+        logger.info(f"Detection rate adjusted: {settings}")
+        self.rate_adjusted.emit(settings)
+
+    def update_camera(self, camera):
+        logger.info("update_camera")
+        try:
+            (camera, _) = self.read_config(*self._frame_size)
+        except Exception as err:
+            self.error_signal.emit(str(err))
+        return camera
+
+    def capture_frames(self, capture):
+        logger.info("capture_frames")
+        seq = 0
+        try:
+            while not self.isInterruptionRequested():
+                ret, frame = capture.read()
+                if ret:
+                    captured = self.telemetry.tick("capture")
+                    seq += 1
+                    self.frames.put((seq, captured, frame))
+        finally:
+            capture.release()
+            self.frames.close()
+
+    def display_frames(self):
+        # Each frame is shown with its own detections, in capture order:
+        # a detected frame waits for earlier frames still in detection, up
+        # to REORDER_WAIT; frames finishing after a later one was shown
+        # are dropped. The receiver marks frames displayed, see displayed().
+        pending = {}
+        shown = 0
+        last = time.perf_counter()
+        while True:
+            timeout = TELEMETRY_INTERVAL
+            if pending:
+                first = pending[min(pending)][0]
+                timeout = max(first + REORDER_WAIT - time.perf_counter(), 0.0)
+            item = self.results.get(timeout=timeout)
+            if item is not None:
+                (seq, captured, frame, res) = item
+                if seq < shown:
+                    self._late += 1
+                else:
+                    pending[seq] = (time.perf_counter(), captured, frame, res)
+            elif self.results.closed and not pending:
+                break
+
+            with self._lock:
+                oldest = min(self._in_detection, default=None)
+            now = time.perf_counter()
+            for seq in sorted(pending):
+                (arrived, captured, frame, res) = pending[seq]
+                if oldest is not None and oldest < seq:
+                    if now < arrived + REORDER_WAIT and not self.results.closed:
+                        break
+                del pending[seq]
+                shown = seq
+                self.frame_ready.emit(frame, res, captured)
 
-    def processing_frame(self, capture):
-        logger.info("processing_frame")
-        while not self.isInterruptionRequested():
-            ret, frame = capture.read()
+            if now - last >= TELEMETRY_INTERVAL:
+                last = now
+                self.telemetry_ready.emit(self.telemetry_snapshot())
 
-            if ret:
-                self.delay_buffer.put(frame)
-                if self.show_video:
-                    frame, data = self.ready_frames.get()
-                    self.frame_ready.emit(frame, data)
+    def displayed(self, captured: float):
+        # Called by the GUI once a frame from frame_ready is on screen.
+        self.telemetry.tick("display", captured)
 
-        capture.release()
+    def telemetry_snapshot(self) -> dict:
+        # Telemetry.snapshot(), the dropped_frames counters and the
+        # settings of the rate controller.
+        snapshot = {**self.telemetry.snapshot(), "dropped": self.dropped_frames}
+        if self.rate_settings is not None:
+            snapshot["rate"] = self.rate_settings
+        return snapshot
 
     def run(self):
         try:
-            thread_pool = QThreadPool()
             capture, width, height = self.init_camera()
             self.camera_resolution.emit(width, height)
+            self._frame_size = (width, height)
             camera, cfg = self.read_config(width, height)
-            thread_pool.start(Worker(self.processing_frame, capture))
-            thread_pool.start(Worker(self.detect, camera, cfg))
+            self._camera = camera
+            if cfg["Camera"]["rateControl"]:
+                self._rate = RateController(cfg["Camera"]["frameBudgetMs"] / 1000)
+                self.rate_settings = self._rate.settings(cfg)
+            self._running = self.workers
+            stages = [threading.Thread(target=self.capture_frames, args=(capture,))]
+            for _ in range(self.workers):
+                stages.append(threading.Thread(target=self.detect, args=(cfg,)))
+            stages.append(threading.Thread(target=self.display_frames))
+            for stage in stages:
+                stage.start()
+            for stage in stages:
+                stage.join()
+            logger.info(f"Camera telemetry: {self.telemetry_snapshot()}")
         except Exception as err:
             self.error_signal.emit(str(err))
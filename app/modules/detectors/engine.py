@@ -0,0 +1,582 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+# Detection engine: worker processes which run BallFinder away from the
+# GUI process. Frames are passed through a ring of shared memory slots,
+# requests and results through a pipe of each process. Imported by the
+# engine processes, so it must not import Qt.
+
+import atexit
+import itertools
+import logging
+import multiprocessing as mp
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from app.ballfinder.ballfinder import BallFinder
+from app.ballfinder.detection import Detection
+from app.ballfinder.instrument import NullInstrument
+from app.ballfinder.stagecache import StageCache
+
+logger = logging.getLogger(__name__)
+
+# Camera models kept by the engine and its processes.
+MAX_CAMERAS = 8
+
+# Seconds between checks of the engine processes and of waiting callers.
+CHECK_INTERVAL = 0.5
+
+CLOSED = "Detection engine closed"
+CRASHED = "Detection engine crashed"
+TIMED_OUT = "Detection engine timed out"
+CANCELLED = "Detection cancelled"
+
+# Result of a process which does not know the camera of a request.
+UNKNOWN_CAMERA = "Unknown camera"
+
+
+class FrameRing:
+    # Shared memory split into equal slots; a frame is copied into a free
+    # slot and the slot is released once no process reads it any more.
+
+    def __init__(self, slots: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.closed = False
+        self._free = list(range(slots))
+        self._cond = threading.Condition()
+
+    def acquire(self, img: np.ndarray, timeout: float = None):
+        # Slot holding a copy of img; None if img does not fit in a slot.
+        if img.nbytes > self.slot_bytes:
+            return None
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free or self.closed, timeout):
+                raise RuntimeError(TIMED_OUT)
+            if self.closed:
+                raise RuntimeError(CLOSED)
+            slot = self._free.pop()
+            # Under the lock, so that close() cannot unmap it meanwhile.
+            view = np.ndarray(
+                img.shape, img.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes
+            )
+            np.copyto(view, img)
+            del view
+        return slot
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._cond:
+            self._free.append(slot)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            self.shm.close()
+            self.shm.unlink()
+
+
+class Pending:
+    # A request waiting for its result.
+
+    def __init__(self, request: tuple, camera, slot):
+        self.request = request
+        self.camera = camera
+        self.slot = slot
+        self.done = threading.Event()
+        self.result = None
+        # Process working on the request, None while it is queued.
+        self.index = None
+        # The caller has returned, see Engine.call().
+        self.gone = False
+        self.crashes = 0
+
+
+class Engine:
+    # Parent side: a dispatcher thread hands out the queued requests to
+    # idle engine processes, each through its own pipe, and routes their
+    # results back to the waiting callers. A dead process is restarted
+    # and its request retried once; a process stuck past a request's
+    # deadline is killed.
+
+    def __init__(self, processes: int, slots: int, slot_bytes: int):
+        self._ctx = mp.get_context("spawn")
+        self._ring = FrameRing(slots, slot_bytes)
+        self._procs = [None] * processes
+        self._conns = [None] * processes
+        # Request each process works on, None if idle.
+        self._assigned = [None] * processes
+        # Keys of the cameras each process keeps, in its own LRU order.
+        self._known = [None] * processes
+        self._queue = deque()
+        self._tickets = itertools.count(1)
+        self._camera_keys = itertools.count(1)
+        self._cameras = OrderedDict()
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # Finders using the engine, see retire().
+        self._users = 0
+        self._retired = False
+        # Wakes the dispatcher up when a request is queued.
+        (self._wake_recv, self._wake_send) = self._ctx.Pipe(duplex=False)
+        for index in range(processes):
+            self.__start(index)
+        self._dispatcher = threading.Thread(target=self.__dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def __start(self, index):
+        (conn, child_conn) = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=engine_main,
+            args=(self._ring.shm.name, self._ring.slot_bytes, child_conn),
+            daemon=True,
+        )
+        proc.start()
+        child_conn.close()
+        if self._conns[index] is not None:
+            self._conns[index].close()
+        self._procs[index] = proc
+        self._conns[index] = conn
+        # A new process knows no cameras yet.
+        self._known[index] = OrderedDict()
+        logger.info(f"Detection engine process {index} started")
+
+    def call(
+        self,
+        method: str,
+        img,
+        args: tuple,
+        cfg: dict,
+        camera=None,
+        cached=False,
+        cancelled=None,
+    ):
+        # Runs a request in an engine process, see run_request(); returns
+        # (value, err). Fails instead of waiting once the engine is closed,
+        # after Engine.timeoutS seconds or once cancelled() is true.
+        if self._closed:
+            return (None, CLOSED)
+        deadline = time.monotonic() + cfg["Engine"]["timeoutS"]
+        key = None if camera is None else self.__camera_key(camera)
+        try:
+            slot = None
+            if img is not None:
+                slot = self._ring.acquire(img, cfg["Engine"]["timeoutS"])
+        except RuntimeError as err:
+            return (None, str(err))
+        frame = None
+        if img is not None:
+            frame = (img.shape, img.dtype.str, img if slot is None else None)
+        request = (method, slot, frame, args, key, cfg, cached)
+        pending = Pending(request, camera, slot)
+        ticket = next(self._tickets)
+        with self._lock:
+            self._waiting[ticket] = pending
+            self._queue.append(pending)
+            self._wake_send.send_bytes(b"")
+        while not pending.done.wait(CHECK_INTERVAL):
+            if self._closed or not self._dispatcher.is_alive():
+                self.__finish(pending, (None, CLOSED))
+            elif cancelled is not None and cancelled():
+                self.__give_up(pending, CANCELLED)
+            elif time.monotonic() > deadline:
+                self.__give_up(pending, TIMED_OUT)
+        with self._lock:
+            self._waiting.pop(ticket)
+            pending.gone = True
+            # Otherwise a process still reads the slot, see __done().
+            release = pending.index is None
+        if release:
+            self._ring.release(slot)
+        return pending.result
+
+    def __camera_key(self, camera):
+        # Cameras are sent to a process once, then named by a key.
+        with self._lock:
+            entry = self._cameras.get(id(camera))
+            if entry is not None and entry[1] is camera:
+                self._cameras.move_to_end(id(camera))
+                return entry[0]
+            key = next(self._camera_keys)
+            self._cameras[id(camera)] = (key, camera)
+            if len(self._cameras) > MAX_CAMERAS:
+                self._cameras.popitem(last=False)
+            return key
+
+    def __give_up(self, pending, err):
+        # The caller stops waiting. A queued request is dropped; a process
+        # past the deadline is killed, its result would come too late.
+        with self._lock:
+            if pending.index is None:
+                if pending in self._queue:
+                    self._queue.remove(pending)
+            elif err == TIMED_OUT:
+                logger.error(f"Detection engine process {pending.index} stuck")
+                self._procs[pending.index].kill()
+        self.__finish(pending, (None, err))
+
+    def __dispatch(self):
+        while not self._closed:
+            self.__assign()
+            sentinels = [proc.sentinel for proc in self._procs]
+            ready = wait(
+                self._conns + sentinels + [self._wake_recv], timeout=CHECK_INTERVAL
+            )
+            if self._closed:
+                break
+            while self._wake_recv.poll():
+                self._wake_recv.recv_bytes()
+            for index, conn in enumerate(self._conns):
+                if conn in ready:
+                    try:
+                        result = conn.recv()
+                    except (EOFError, OSError):
+                        # Died, restarted below.
+                        continue
+                    self.__done(index, result)
+            for index, proc in enumerate(self._procs):
+                if not self._closed and not proc.is_alive():
+                    self.__restart(index)
+
+    def __assign(self):
+        # Sends queued requests to the idle processes.
+        for index, conn in enumerate(self._conns):
+            if self._assigned[index] is not None:
+                continue
+            with self._lock:
+                if not self._queue:
+                    return
+                pending = self._queue.popleft()
+                pending.index = index
+            self._assigned[index] = pending
+            try:
+                key = pending.request[4]
+                known = self._known[index]
+                if key is not None and key not in known:
+                    conn.send(("camera", (key, pending.camera)))
+                    known[key] = None
+                    if len(known) > MAX_CAMERAS:
+                        known.popitem(last=False)
+                if key is not None:
+                    known.move_to_end(key)
+                conn.send(("request", pending.request))
+            except (EOFError, OSError):
+                # Died, restarted by the dispatcher.
+                pass
+
+    def __done(self, index, result):
+        pending = self._assigned[index]
+        self._assigned[index] = None
+        if pending is None:
+            return
+        with self._lock:
+            pending.index = None
+            release = pending.gone
+        if release:
+            self._ring.release(pending.slot)
+        self.__finish(pending, result)
+
+    def __finish(self, pending, result):
+        with self._lock:
+            if pending.done.is_set():
+                return
+            pending.result = result
+            pending.done.set()
+
+    def __restart(self, index):
+        pending = self._assigned[index]
+        self._assigned[index] = None
+        logger.error(f"Detection engine process {index} died, restarting")
+        self.__start(index)
+        if pending is None:
+            return
+        with self._lock:
+            pending.index = None
+            pending.crashes += 1
+            retry = not pending.done.is_set() and pending.crashes <= 1
+            if retry:
+                self._queue.appendleft(pending)
+            release = pending.gone
+        if release:
+            self._ring.release(pending.slot)
+        elif not retry:
+            self.__finish(pending, (None, CRASHED))
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+        if close:
+            self.close()
+
+    def retire(self):
+        # Replaced by another engine: closed once its last finder is gone.
+        with self._lock:
+            self._retired = True
+            close = self._users == 0
+        if close:
+            self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            waiting = list(self._waiting.values())
+            self._wake_send.send_bytes(b"")
+        for pending in waiting:
+            self.__finish(pending, (None, CLOSED))
+        # The dispatcher sends nothing any more once it has stopped.
+        self._dispatcher.join(timeout=2.0)
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (EOFError, OSError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout=2.0)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._ring.close()
+
+
+class EngineFinder:
+    # Stand-in for BallFinder which runs the detection in the engine. The
+    # config is sent with every request, so it can be replaced at any time.
+    # The engine stays open while a finder uses it.
+
+    def __init__(self, engine: Engine, cfg: dict, cached: bool = False, cancelled=None):
+        # cached: keep the 2D stages in the engine, see ImageDetector
+        # cancelled: callable, true once the caller stops waiting
+        self.engine = engine
+        self.cfg = cfg
+        self.cached = cached
+        self.cancelled = cancelled
+        self.instr = NullInstrument()
+        engine.acquire()
+        weakref.finalize(self, engine.release)
+
+    def find_balls(self, img_bgr, radius, camera, scale=1.0):
+        (value, err) = self.engine.call(
+            "find_balls",
+            img_bgr,
+            (radius, scale),
+            self.cfg,
+            camera,
+            self.cached,
+            self.cancelled,
+        )
+        if value is None:
+            return ([], err)
+        (cands, conts, balls) = value
+        return (self.__detections(cands, conts, balls, radius, camera), err)
+
+    def find_candidates(self, img_bgr, scale=1.0):
+        (value, err) = self.engine.call(
+            "find_candidates",
+            img_bgr,
+            (scale,),
+            self.cfg,
+            cached=self.cached,
+            cancelled=self.cancelled,
+        )
+        if value is None:
+            return ([], [], err)
+        (cands, conts) = value
+        return (cands, conts, err)
+
+    def locate(self, cands, conts, radius, camera):
+        (balls, err) = self.engine.call(
+            "locate",
+            None,
+            (cands, conts, radius),
+            self.cfg,
+            camera,
+            cancelled=self.cancelled,
+        )
+        if err:
+            raise Exception(err)
+        return self.__detections(cands, conts, balls, radius, camera)
+
+    def __detections(self, cands, conts, balls, radius, camera):
+        return [
+            Detection(ball, cand, cont, radius, camera, self.cfg)
+            for (cand, cont, ball) in zip(cands, conts, balls)
+        ]
+
+
+_engine = None
+_engine_settings = None
+# Replaced engines still in use, see Engine.retire().
+_retired = []
+_engine_lock = threading.RLock()
+
+
+def get_engine(cfg: dict) -> Engine:
+    # The shared engine, started on first use and again after its
+    # settings change.
+    global _engine, _engine_settings
+    settings = (
+        cfg["Engine"]["processes"],
+        cfg["Engine"]["slots"],
+        cfg["Engine"]["slotMB"],
+    )
+    with _engine_lock:
+        if _engine is not None and settings != _engine_settings:
+            # Finders of the old engine go on with it until they are gone.
+            _engine.retire()
+            _retired[:] = [e for e in _retired if not e.closed] + [_engine]
+            _engine = None
+        if _engine is None:
+            (processes, slots, slot_mb) = settings
+            _engine = Engine(processes, slots, slot_mb * 2**20)
+            _engine_settings = settings
+        return _engine
+
+
+def close_engine():
+    global _engine
+    with _engine_lock:
+        for engine in _retired:
+            engine.close()
+        _retired.clear()
+        if _engine is not None:
+            _engine.close()
+            _engine = None
+
+
+atexit.register(close_engine)
+
+
+def create_ball_finder(cfg: dict, instr=None, cache=None, cancelled=None):
+    # BallFinder, or its stand-in running in the engine if it is enabled;
+    # cancelled, e.g. QThread.isInterruptionRequested, ends its waiting.
+    if cfg["Engine"]["enabled"]:
+        # Under the lock: the engine must not be retired before it is used.
+        with _engine_lock:
+            engine = get_engine(cfg)
+            return EngineFinder(engine, cfg, cache is not None, cancelled)
+    return BallFinder(cfg, instr, cache)
+
+
+def engine_main(shm_name, slot_bytes, conn):
+    # Entry point of an engine process: serves the requests of its pipe
+    # one at a time.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    cameras = OrderedDict()
+    finders = {}
+    cache = StageCache()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        (kind, payload) = message
+        if kind == "camera":
+            # Kept in the same order as Engine._known.
+            (key, camera) = payload
+            cameras[key] = camera
+            if len(cameras) > MAX_CAMERAS:
+                cameras.popitem(last=False)
+            continue
+        (method, slot, frame, args, key, cfg, cached) = payload
+        try:
+            camera = None
+            if key is not None:
+                if key not in cameras:
+                    raise LookupError(UNKNOWN_CAMERA)
+                cameras.move_to_end(key)
+                camera = cameras[key]
+            img = None
+            if frame is not None:
+                (shape, dtype, img) = frame
+                if img is None:
+                    img = np.ndarray(
+                        shape, dtype, buffer=shm.buf, offset=slot * slot_bytes
+                    )
+            finder = engine_finder(finders, cfg, cache if cached else None)
+            result = run_request(finder, method, img, args, camera)
+        except Exception as err:
+            result = (None, str(err))
+        # Drop the view of the slot before it is released.
+        img = None
+        conn.send(result)
+    shm.close()
+
+
+def engine_finder(finders, cfg, cache):
+    # BallFinder of an engine process, one per detector and cache use.
+    detector = (cfg["Detector"], cfg["YOLO"]["model"], cache is not None)
+    if detector not in finders:
+        finders[detector] = BallFinder(cfg, cache=cache)
+    finder = finders[detector]
+    finder.cfg = cfg
+    return finder
+
+
+def run_request(finder, method, img, args, camera):
+    # Returns (value, err), see EngineFinder.
+    if method == "find_candidates":
+        (scale,) = args
+        (cands, conts, err) = finder.find_candidates(img, scale)
+        return ((cands, conts), err)
+    if method == "find_balls":
+        (radius, scale) = args
+        (cands, conts, err) = finder.find_candidates(img, scale)
+        if err:
+            return (None, err)
+        res = finder.locate(cands, conts, radius, camera)
+        return ((cands, conts, target_centers(res)), "")
+    if method == "locate":
+        (cands, conts, radius) = args
+        res = finder.locate(cands, conts, radius, camera)
+        return (target_centers(res), "")
+    raise ValueError(f"Unknown engine request: {method}")
+
+
+def target_centers(res):
+    # Ball centers of detections, as Detection takes them.
+    return [np.array(data["target"][:3]) for data in res]
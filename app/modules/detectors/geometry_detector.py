@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import logging
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from app.ballfinder.ballfinder import locate_balls
+from app.ballfinder.cammodel import CameraModel
+from app.ballfinder.dettable import build_table
+from app.config.config import config
+from app.lib.config import attach_ray_lut, read_camera_config
+
+logger = logging.getLogger(__name__)
+
+
+class GeometryDetector(QThread):
+    data_ready = pyqtSignal(object)
+    error_signal = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._config_path = None
+        self._diameter = None
+        self._store = None
+        self._width = None
+        self._height = None
+
+    def set_config(self, diameter, config_path, store, width, height):
+        # store: DetectionStore of a finished VideoDetector run
+        self._diameter = diameter
+        self._config_path = config_path
+        self._store = store
+        self._width = width
+        self._height = height
+
+    def locate(self):
+        camera = read_camera_config(self._config_path, self._height, self._width)
+        cfg = config.values
+        camera = CameraModel(
+            attach_ray_lut(camera, self._config_path, self._height, self._width, cfg)
+        )
+
+        candidates = self._store.candidates()
+        logger.info(f"Re-solve {len(candidates)} frames")
+        numbers = sorted(candidates)
+        frames = [candidates[i] for i in numbers]
+        radius = self._diameter / 2
+        res = locate_balls(frames, radius, camera, cfg)
+        located = [
+            (i, cands, [data["target"][:3] for data in dets])
+            for (i, (cands, _), dets) in zip(numbers, frames, res)
+        ]
+        return build_table(located, radius, camera, cfg)
+
+    def run(self):
+        try:
+            balls = self.locate()
+            if not self.isInterruptionRequested():
+                self.data_ready.emit(balls)
+        except Exception as err:
+            logger.info("Geometry Processing Error")
+            self.error_signal.emit(str(err))
@@ -28,17 +28,31 @@ import cv2
 import numpy as np
 from PyQt6.QtCore import QThread, pyqtSignal
 
-from app.ballfinder.ballfinder import BallFinder
+from app.ballfinder.cammodel import CameraModel
+from app.ballfinder.detection import Detection, project_detections
+from app.ballfinder.stagecache import StageCache
 from app.config.config import config
-from app.lib.config import read_camera_config
+from app.lib.config import attach_ray_lut, read_camera_config
 from app.lib.drawing import draw_contour, draw_center, draw_text
+from app.lib.results_cache import (
+    evict,
+    load_photo_results,
+    results_key,
+    save_photo_results,
+)
+from app.modules.detectors.engine import create_ball_finder
 
 logger = logging.getLogger(__name__)
 
+# Shared by the detector threads, which run one at a time: re-detecting
+# a photo after a settings change only re-runs the affected stages.
+stage_cache = StageCache()
+
 
 class ImageDetector(QThread):
     image_ready = pyqtSignal(np.ndarray)
     image_data = pyqtSignal(list)
+    candidates_ready = pyqtSignal(tuple)
     error_signal = pyqtSignal(str)
 
     def __init__(self):
@@ -46,37 +60,59 @@ class ImageDetector(QThread):
         self._config_path = None
         self._img = None
         self._diameter = None
+        self._candidates = None
 
-    def set_config(self, diameter, config_path, img):
+    def set_config(self, diameter, config_path, img, candidates=None):
+        # candidates: (cands, conts) of an earlier run on the same image
+        # and settings; only the 3D geometry is solved again then.
         self._diameter = diameter
         self._config_path = config_path
         self._img = img
+        self._candidates = candidates
 
     def detect_image(self, image) -> (np.ndarray, list):
         height, width, _ = image.shape
-        camera = read_camera_config(self._config_path, height, width)
+        cfg = config.values
+        media = self._img if isinstance(self._img, str) else image
+        (cache_path, camera, cached) = load_cached_photo(
+            media, image, self._config_path, self._diameter, cfg
+        )
+        if cached is not None:
+            logger.info("Photo results found in the cache")
+            (candidates, res) = cached
+            self.candidates_ready.emit(candidates)
+            return draw_detections(image, res), res
         if self.isInterruptionRequested():
             return None, []
 
-        cfg = config.values
+        camera = CameraModel(
+            attach_ray_lut(camera, self._config_path, height, width, cfg)
+        )
         if self.isInterruptionRequested():
             return None, []
 
         logger.debug(f"findTargets; diameter: {self._diameter}")
-        ball_finder = BallFinder(cfg)
-        (res, err) = ball_finder.find_balls(image, self._diameter / 2, camera)
-
-        logger.debug(f"res: {res}")
-        if err:
-            logger.error(f"findTargets error: {err}")
-            raise Exception(err)
+        radius = self._diameter / 2
+        ball_finder = create_ball_finder(
+            cfg, cache=stage_cache, cancelled=self.isInterruptionRequested
+        )
+        if self._candidates is None:
+            (cands, conts, err) = ball_finder.find_candidates(image)
+            if err:
+                logger.error(f"findTargets error: {err}")
+                raise Exception(err)
+            self.candidates_ready.emit((cands, conts))
+        else:
+            (cands, conts) = self._candidates
         if self.isInterruptionRequested():
             return None, []
 
-        draw_contour(image, res)
-        draw_center(image, res)
-        draw_text(image, res)
-        return image, res
+        res = ball_finder.locate(cands, conts, radius, camera)
+        balls = [data["target"][:3] for data in res]
+        save_photo_results(cache_path, cands, conts, balls)
+        evict(cfg["Cache"]["maxMB"] * 2**20, keep=cache_path)
+        logger.debug(f"res: {res}")
+        return draw_detections(image, res), res
 
     def start_tread(self) -> (np.ndarray, list):
         if isinstance(self._img, str):
@@ -101,3 +137,30 @@ class ImageDetector(QThread):
         except Exception as err:
             logger.error(f"ImageDetector err: {err}")
             self.error_signal.emit(str(err))
+
+
+def load_cached_photo(media, image, config_path, diameter, cfg):
+    # Looks a photo up in the results cache; returns (cache_path, camera,
+    # cached), cached being ((cands, conts), detections) or None on a miss.
+    # A hit needs neither the ray LUT nor a detector.
+    height, width, _ = image.shape
+    camera = read_camera_config(config_path, height, width)
+    cache_path = results_key("photo", media, cfg, camera, diameter)
+    cached = load_photo_results(cache_path)
+    if cached is None:
+        return cache_path, camera, None
+    (cands, conts, balls) = cached
+    model = CameraModel(camera)
+    res = [
+        Detection(ball, cand, cont, diameter / 2, model, cfg)
+        for (cand, cont, ball) in zip(cands, conts, balls)
+    ]
+    return cache_path, camera, ((cands, conts), res)
+
+
+def draw_detections(image, res) -> np.ndarray:
+    project_detections(res)
+    draw_contour(image, res)
+    draw_center(image, res)
+    draw_text(image, res)
+    return image
@@ -23,20 +23,30 @@
 #############################################################################
 
 import logging
+import multiprocessing as mp
+import threading
+from queue import Empty, Full, Queue
 
 import cv2
 from PyQt6.QtCore import QThread, pyqtSignal
 from moviepy import VideoFileClip
 
-from app.ballfinder.ballfinder import BallFinder
+from app.ballfinder.ballfinder import locate_balls
+from app.ballfinder.cammodel import CameraModel
+from app.ballfinder.instrument import Instrument
 from app.config.config import config
-from app.lib.config import read_camera_config
+from app.lib.config import attach_ray_lut, read_camera_config
+from app.lib.detection_store import DetectionStore, load_table, video_store_path
+from app.lib.results_cache import evict, touch
+from app.modules.detectors.engine import create_ball_finder
+from app.modules.detectors.video_worker import detect_chunk, init_worker, seek
 
 logger = logging.getLogger(__name__)
 
 
 class VideoDetector(QThread):
-    data_ready = pyqtSignal(dict)
+    data_ready = pyqtSignal(object)
+    candidates_ready = pyqtSignal(object, int, int)
     video_progress = pyqtSignal(float)
     error_signal = pyqtSignal(str)
 
@@ -52,39 +62,231 @@ class VideoDetector(QThread):
         self._video_path = video_path
 
     def detect_video(self):
-        video = cv2.VideoCapture(self._video_path)
         clip = VideoFileClip(self._video_path)
-        if video is None:
-            raise Exception("Error loading the video.")
-
         width, height = clip.size
-        camera = read_camera_config(self._config_path, height, width)
-
         frame_count = clip.reader.n_frames - 1
+        camera = read_camera_config(self._config_path, height, width)
 
         cfg = config.values
+        store = DetectionStore(
+            video_store_path(self._video_path, cfg, camera, self._diameter)
+        )
+        touch(store.path)
+        if store.done:
+            # A hit needs neither the ray LUT nor a decoder; the store is
+            # left as it is, a stop now must not un-mark it.
+            logger.info("Video results found in the cache")
+            camera = CameraModel(camera)
+        else:
+            camera = CameraModel(
+                attach_ray_lut(camera, self._config_path, height, width, cfg)
+            )
+            logger.info("Start video detector")
+            self.detect_store(store, camera, cfg, frame_count)
+        if self.isInterruptionRequested():
+            return None
+        table = load_table(store, self._diameter / 2, camera, cfg)
+        evict(cfg["Cache"]["maxMB"] * 2**20, keep=store.path)
+        self.candidates_ready.emit(store, width, height)
+        return table
+
+    def detect_store(self, store, camera, cfg, frame_count):
+        # Detects the frames after the store's last checkpoint.
+        start = store.resume()
+        try:
+            if cfg["Video"]["processes"] > 1:
+                self.detect_parallel(store, start, camera, cfg, frame_count)
+            else:
+                video = cv2.VideoCapture(self._video_path)
+                if not video.isOpened():
+                    raise Exception("Error loading the video.")
+                try:
+                    seek(video, start - 1)
+                    self.detect_pipeline(store, start, video, camera, cfg, frame_count)
+                finally:
+                    video.release()
+            store.checkpoint(done=not self.isInterruptionRequested())
+        finally:
+            store.close()
+
+    def store_frame(self, store, i, cands, conts, res, err, cfg):
+        if err:
+            logger.debug(f"findTargets error: {err}")
+            logger.info(f"skip {i} frame")
+        balls = [data["target"][:3] for data in res]
+        store.append(i, cands, conts, balls, err)
+        if i % cfg["Video"]["checkpointFrames"] == 0:
+            store.checkpoint()
+
+    def detect_pipeline(self, store, start, video, camera, cfg, frame_count):
+        # A decode thread reads ahead into a bounded queue, detection
+        # threads (each with its own BallFinder) consume it, and this
+        # thread writes the results to the store in frame order. Memory
+        # is bounded by the queue size, not by the video length.
+        threads = cfg["Video"]["threads"]
+        frames = Queue(maxsize=cfg["Video"]["queueSize"])
+        results = Queue()
+        stop = threading.Event()
+        instr = None
+        if cfg["Instrument"]["enabled"]:
+            instr = Instrument(cfg["Instrument"]["window"])
+        ball_finders = [
+            create_ball_finder(cfg, instr, cancelled=self.isInterruptionRequested)
+            for _ in range(threads)
+        ]
 
-        logger.info("Start video detector")
-        i = 0
-        data = {}
-        ball_finder = BallFinder(cfg)
-        while not self.isInterruptionRequested():
+        workers = [
+            threading.Thread(
+                target=self.decode, args=(video, start, frames, stop, threads)
+            )
+        ]
+        for ball_finder in ball_finders:
+            workers.append(
+                threading.Thread(
+                    target=self.detect_frames,
+                    args=(ball_finder, camera, frames, results, stop),
+                )
+            )
+        for worker in workers:
+            worker.start()
+
+        pending = {}
+        i = start
+        running = threads
+        try:
+            while running > 0 and not self.isInterruptionRequested():
+                try:
+                    item = results.get(timeout=0.1)
+                except Empty:
+                    continue
+                if item is None:
+                    running -= 1
+                    continue
+                pending[item[0]] = item
+                while i in pending:
+                    (_, cands, conts, res, err) = pending.pop(i)
+                    self.store_frame(store, i, cands, conts, res, err, cfg)
+                    logger.info(f"Processed {i}/{frame_count} frame")
+                    if instr is not None and instr.frames % instr.window == 0:
+                        logger.info(f"Detection stages: {instr.summary()}")
+                    self.video_progress.emit(i / frame_count)
+                    i += 1
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+    def decode(self, video, start, frames, stop, threads):
+        i = start - 1
+        while not stop.is_set():
             ret, frame = video.read()
             if not ret:
                 break
             i += 1
+            self.put(frames, (i, frame), stop)
+        # One end marker per detection thread.
+        for _ in range(threads):
+            self.put(frames, None, stop)
+
+    def detect_frames(self, ball_finder, camera, frames, results, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    item = frames.get(timeout=0.1)
+                except Empty:
+                    continue
+                if item is None:
+                    break
+                (i, frame) = item
+                (cands, conts, err) = ball_finder.find_candidates(frame)
+                res = []
+                if not err:
+                    try:
+                        radius = self._diameter / 2
+                        res = ball_finder.locate(cands, conts, radius, camera)
+                    except Exception as e:
+                        err = str(e)
+                results.put((i, cands, conts, res, err))
+        finally:
+            # End marker of this thread, also if it failed.
+            results.put(None)
+
+    @staticmethod
+    def put(queue, item, stop):
+        # Blocking put which gives up once the pipeline is stopped.
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
 
-            (res, err) = ball_finder.find_balls(frame, self._diameter / 2, camera)
+    def detect_parallel(self, store, start, camera, cfg, frame_count):
+        # Worker processes detect the 2D candidates of frame ranges, each
+        # decoding its own range; the 3D geometry of a range is solved
+        # here in one batch. Ranges come back in order.
+        processes = cfg["Video"]["processes"]
+        chunk = cfg["Video"]["chunkFrames"]
+        tasks = [
+            (self._video_path, first, first + chunk)
+            for first in range(start, frame_count + 1, chunk)
+        ]
+        if not tasks:
+            tasks = [(self._video_path, start, None)]
+        tasks[-1] = (self._video_path, tasks[-1][1], None)
 
+        ctx = mp.get_context("spawn")
+        cancel = ctx.Event()
+        logger.info(f"Start {processes} video worker processes")
+        with ctx.Pool(processes, init_worker, (cfg, cancel)) as pool:
+            chunks = pool.imap(detect_chunk, tasks)
+            while True:
+                # Waits in short steps, so that a stop does not wait for
+                # a whole chunk; leaving the pool terminates the workers.
+                try:
+                    (first, results) = chunks.next(timeout=0.1)
+                except mp.TimeoutError:
+                    if self.isInterruptionRequested():
+                        cancel.set()
+                        break
+                    continue
+                except StopIteration:
+                    break
+                if self.isInterruptionRequested():
+                    cancel.set()
+                    break
+                located = self.locate_chunk(results, camera, cfg)
+                for (i, cands, conts, _), (res, err) in zip(results, located):
+                    self.store_frame(store, i, cands, conts, res, err, cfg)
+                if results:
+                    i = results[-1][0]
+                    logger.info(f"Processed {i}/{frame_count} frame")
+                    self.video_progress.emit(min(i / frame_count, 1.0))
+
+    def locate_chunk(self, results, camera, cfg):
+        # (res, err) of each frame of a chunk. The chunk is solved in one
+        # batch; if that fails, frame by frame, so that a failing frame
+        # gets its own error as in detect_frames().
+        radius = self._diameter / 2
+        frames = [(cands, conts) for (_, cands, conts, err) in results if not err]
+        try:
+            located = iter(locate_balls(frames, radius, camera, cfg))
+        except Exception as e:
+            logger.debug(f"Chunk not located at once: {e}")
+            located = None
+        res = []
+        for _, cands, conts, err in results:
             if err:
-                logger.debug(f"findTargets error: {err}")
-                logger.info(f"skip {i} frame")
+                res.append(([], err))
+            elif located is not None:
+                res.append((next(located), err))
             else:
-                data[i] = res
-            logger.info(f"Processed {i}/{frame_count} frame")
-            self.video_progress.emit(i / frame_count)
-        video.release()
-        return data
+                try:
+                    [balls] = locate_balls([(cands, conts)], radius, camera, cfg)
+                    res.append((balls, err))
+                except Exception as e:
+                    res.append(([], str(e)))
+        return res
 
     def run(self):
         try:
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#############################################################################
+## Call-A-Ball: an open-source demonstrator of 3D object localization
+## based on camera images and the geometric camera calibration,
+## completed with the help of the Radiant Metrics cloud service.
+##
+## Copyright (C) 2024 HS High Stake GmbH
+##
+## This program is free software: you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+## See the GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program. If not, see <https://www.gnu.org/licenses/>.
+##
+## Contact: call-a-ball@high-stake.de
+#############################################################################
+
+import logging
+
+import cv2
+
+from app.ballfinder.ballfinder import BallFinder
+
+logger = logging.getLogger(__name__)
+
+# State of a worker process, see init_worker().
+worker = {}
+
+
+def init_worker(cfg, cancel):
+    # Runs once per worker process: the detector stays warm for all chunks.
+    worker["ball_finder"] = BallFinder(cfg)
+    worker["cancel"] = cancel
+
+
+def seek(video, index: int) -> bool:
+    # Positions a capture before frame `index` (counted from 0). Seeking
+    # lands on a keyframe with many codecs, so the reported position is
+    # checked and the remaining frames are decoded; False if the video
+    # ends before.
+    pos = 0
+    if index > 0 and video.set(cv2.CAP_PROP_POS_FRAMES, index):
+        pos = int(video.get(cv2.CAP_PROP_POS_FRAMES))
+    if pos <= 0 or pos > index:
+        video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        pos = 0
+    for _ in range(pos, index):
+        if not video.grab():
+            return False
+    return True
+
+
+def detect_chunk(task):
+    # task: (video_path, start, stop), frame numbers counted from 1 as in
+    # VideoDetector, stop excluded, None to read to the end.
+    # Returns (start, [(i, cands, conts, err)]) for the frames read, fewer
+    # if the video ends or the run is cancelled.
+    (video_path, start, stop) = task
+    ball_finder = worker["ball_finder"]
+    cancel = worker["cancel"]
+
+    video = cv2.VideoCapture(video_path)
+    results = []
+    i = start
+    found = seek(video, start - 1)
+    while found and (stop is None or i < stop):
+        if cancel.is_set():
+            break
+        ret, frame = video.read()
+        if not ret:
+            break
+        (cands, conts, err) = ball_finder.find_candidates(frame)
+        results.append((i, cands, conts, err))
+        i += 1
+    video.release()
+    return (start, results)
@@ -23,13 +23,16 @@
 #############################################################################
 
 import logging
+from functools import partial
 from typing import TYPE_CHECKING
 
 from PyQt6.QtGui import QPixmap
 from PyQt6.QtWidgets import QLabel
 from app.components.select_file import SelectFile
+from app.config.config import config
 from app.modules.detectors.image_detector import ImageDetector
 from app.lib.formaters import np_to_pixmap
+from app.lib.results_cache import detection_settings
 from app.lib.ui import handle_error, update_pixmap
 
 logger = logging.getLogger(__name__)
@@ -45,6 +48,9 @@ class PhotoModule:
         self._config_path = None
         self._diameter = None
         self.thread_img: ImageDetector or None = None
+        # 2D results of the last run, reused when only the diameter or
+        # the calibration changes: ((photo_path, settings), (cands, conts))
+        self._candidates = None
         self._main_window = main_window
         self.pixmap = None
         self.select_photo = self._main_window.findChild(SelectFile, "select_photo")
@@ -77,16 +83,33 @@ class PhotoModule:
     def photo_processing(self):
         logger.info("photo_processing")
         self.stop_thread()
+        self.pixmap = QPixmap(self.photo_path)
+        self.resize()
+        # Key of the settings this run detects with.
+        key = self.candidates_key
+
         self.thread_img = ImageDetector()
         self.thread_img.image_ready.connect(self.update_image)
         self.thread_img.image_ready.connect(self.stop_thread)
         self.thread_img.error_signal.connect(handle_error)
-
-        self.pixmap = QPixmap(self.photo_path)
-        self.resize()
-        self.thread_img.set_config(self.diameter, self.config_path, self.photo_path)
+        self.thread_img.candidates_ready.connect(partial(self.store_candidates, key))
+
+        candidates = None
+        if self._candidates and self._candidates[0] == key:
+            logger.info("reuse 2D candidates")
+            candidates = self._candidates[1]
+        self.thread_img.set_config(
+            self.diameter, self.config_path, self.photo_path, candidates
+        )
         self.thread_img.start()
 
+    @property
+    def candidates_key(self):
+        return (self.photo_path, detection_settings(config.values))
+
+    def store_candidates(self, key, candidates: tuple):
+        self._candidates = (key, candidates)
+
     def stop_thread(self):
         logger.debug("thread_img delete")
         if self.thread_img:
@@ -24,6 +24,7 @@
 
 import logging
 
+from functools import partial
 from typing import TYPE_CHECKING
 from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import (
@@ -33,10 +34,13 @@ from PyQt6.QtWidgets import (
 )
 
 from app.components.select_file import SelectFile
+from app.config.config import config
+from app.modules.detectors.geometry_detector import GeometryDetector
 from app.modules.detectors.image_detector import ImageDetector
 from app.modules.detectors.video_detector import VideoDetector
 from app.modules.video_player_module import VideoPlayerModule
 from app.lib.calc import is_point_in_circle
+from app.lib.results_cache import detection_settings
 from app.lib.ui import handle_error
 
 logger = logging.getLogger(__name__)
@@ -51,6 +55,16 @@ class VideoModule:
         self.thread_img = None
         self.thread_video = None
         self._main_window = main_window
+        # 2D results of the last full run, see store_candidates()
+        self._candidates = None
+        # Diameter and calibration of the shown results
+        self._geometry = None
+
+        # Re-solve once the diameter input has settled.
+        self.geometry_timer = QTimer()
+        self.geometry_timer.setSingleShot(True)
+        self.geometry_timer.setInterval(500)
+        self.geometry_timer.timeout.connect(self.geometry_processing)
 
         self.select_video = self._main_window.findChild(SelectFile, "select_video")
 
@@ -112,21 +126,60 @@ class VideoModule:
     def is_video_select(self):
         return self._main_window.radio_video.isChecked()
 
+    @property
+    def candidates_key(self):
+        return (self.video_path, detection_settings(config.values))
+
+    @property
+    def has_candidates(self):
+        return bool(self._candidates) and self._candidates[0] == self.candidates_key
+
     def video_processing(self):
         logger.info("video_processing")
+        if self.has_candidates:
+            self.geometry_processing()
+            return
         self.update_progress(0)
         self.widget_progress_video.show()
         self.set_enabled_controls(False)
         self.video_player.pause()
 
         self.stop_thread()
+        self._geometry = (self.diameter, self.config_path)
+        # Key of the settings this run detects with.
+        key = self.candidates_key
         self.thread_video = VideoDetector()
         self.thread_video.video_progress.connect(self.update_progress)
         self.thread_video.data_ready.connect(self.update_video_data)
+        self.thread_video.candidates_ready.connect(partial(self.store_candidates, key))
         self.thread_video.error_signal.connect(handle_error)
         self.thread_video.set_config(self.diameter, self.config_path, self.video_path)
         self.thread_video.start()
 
+    def store_candidates(self, key, store: object, width: int, height: int):
+        logger.info("store_candidates")
+        self._candidates = (key, store, width, height)
+
+    def geometry_processing(self):
+        logger.info("geometry_processing")
+        if not self.has_candidates:
+            return
+        (_, store, width, height) = self._candidates
+        self.update_progress(0)
+        self.widget_progress_video.show()
+        self.set_enabled_controls(False)
+        self.video_player.pause()
+
+        self.stop_thread()
+        self._geometry = (self.diameter, self.config_path)
+        self.thread_video = GeometryDetector()
+        self.thread_video.data_ready.connect(self.update_video_data)
+        self.thread_video.error_signal.connect(handle_error)
+        self.thread_video.set_config(
+            self.diameter, self.config_path, store, width, height
+        )
+        self.thread_video.start()
+
     def stop_thread(self):
         logger.debug("thread_video delete")
         if self.thread_video:
@@ -160,8 +213,14 @@ class VideoModule:
             logger.debug("check_field: ready")
             self.btn_process_video.setEnabled(True)
             self.btn_detect_ball.setEnabled(True)
+            if self.has_candidates and self._geometry != (
+                self.diameter,
+                self.config_path,
+            ):
+                self.geometry_timer.start()
         else:
             logger.debug("check_field: not ready")
+            self.geometry_timer.stop()
             self.stop()
             self.btn_process_video.setEnabled(False)
             self.btn_detect_ball.setEnabled(False)
@@ -202,7 +261,7 @@ class VideoModule:
     def play_handler(self):
         self.btn_apply_coords_set_enabled(False)
 
-    def update_video_data(self, balls: dict):
+    def update_video_data(self, balls: object):
         logger.info("update_video_data")
         self.video_player.set_balls(balls)
         self.stop()
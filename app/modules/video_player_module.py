@@ -24,6 +24,7 @@
 
 import logging
 from collections import defaultdict
+from collections.abc import Mapping
 from typing import Any
 
 import numpy as np
@@ -157,8 +158,12 @@ class VideoPlayerModule(QObject):
     def set_current_balls(self, balls: list[Any]):
         self.balls[self.current_frame_number] = balls
 
-    def set_balls(self, balls: dict):
-        self.balls = defaultdict(lambda: [], balls)
+    def set_balls(self, balls: Mapping):
+        # A DetectionTable reads its memory-mapped rows and projects a
+        # frame's detections when the frame is first shown.
+        if isinstance(balls, dict):
+            balls = defaultdict(lambda: [], balls)
+        self.balls = balls
 
     def set_video(self, video_path: str or None):
         logger.debug(f"set_video: {video_path}")
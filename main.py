@@ -27,13 +27,15 @@
 import logging
 import sys
 
-from PyQt6.QtWidgets import QApplication
-
-from app.windows.main import CallABall
-
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
+    # Imported here: spawned processes (detection engine, video workers)
+    # run this module as __mp_main__ and must not load the GUI.
+    from PyQt6.QtWidgets import QApplication
+
+    from app.windows.main import CallABall
+
     logging.basicConfig(level=logging.INFO)
 
     app = QApplication(sys.argv)